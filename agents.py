@@ -0,0 +1,202 @@
+from itertools import chain
+
+try:
+    import numpy as np
+except ImportError:  # only needed for observations
+    np = None
+
+from controls import Controls, IDLE
+from utils import rng
+
+# ship: x, y, vx, vy, direction x, direction y, alive
+SHIP_FEATURES = 7
+# per asteroid, nearest first: dx, dy (shortest offset across the wrap),
+# vx, vy, radius, present (0 for the padding rows when fewer are left)
+ASTEROID_FEATURES = 6
+
+
+def observation_size(k):
+    return SHIP_FEATURES + k * ASTEROID_FEATURES
+
+
+class Controller:
+    """
+    Base class for anything that plays the game instead of the keyboard.
+
+    The game calls act() once per tick with the observation of its k nearest
+    asteroids (see Observer) and applies the Controls it returns. The
+    observation array is reused every tick; copy it to keep it.
+    """
+    k = 8
+
+    def act(self, observation):
+        return IDLE
+
+
+class TurretController(Controller):
+    """Turn toward the nearest asteroid and fire when facing it."""
+
+    def __init__(self, k=1, fire_every=8):
+        self.k = k
+        self.fire_every = fire_every
+        self._tick = 0
+
+    def act(self, observation):
+        self._tick += 1
+        if not observation[6] or not observation[SHIP_FEATURES + 5]:
+            return IDLE
+        dx, dy = observation[SHIP_FEATURES:SHIP_FEATURES + 2]
+        ux, uy = observation[4:6]
+        # sign of the cross product: positive when the target is clockwise
+        # on screen (y points down), and the cosine of the angle to it
+        cross = ux * dy - uy * dx
+        cos = (ux * dx + uy * dy) / max((dx * dx + dy * dy) ** 0.5, 1e-9)
+        turn = 0 if cos > 0.999 else 1 if cross > 0 else -1
+        fire = int(cos > 0.99 and self._tick % self.fire_every == 0)
+        return Controls(turn=turn, fire=fire)
+
+
+def _fill(out, vectors):
+    # numpy reads a list of Vector2 one coordinate at a time; a flat run of
+    # floats goes in at once
+    if isinstance(vectors, np.ndarray):
+        out[:] = vectors
+    else:
+        out[:] = np.fromiter(chain.from_iterable(vectors), np.float64,
+                             out.size).reshape(out.shape)
+
+
+class Observer:
+    """
+    Fills a preallocated observation vector from a game: the ship's state
+    followed by the k nearest asteroids on the torus, nearest first (see
+    SHIP_FEATURES and ASTEROID_FEATURES). Distances are in pixels and
+    velocities in pixels per tick.
+
+    observe() always returns the same array (out, when given, so a batch of
+    observers can write into the rows of one matrix); the scratch arrays
+    used to rank asteroids only grow when there are more of them than ever.
+    The asteroids are copied in bulk from game._asteroid_motion(), so the
+    cost per call barely depends on how many there are.
+    """
+
+    def __init__(self, size, k=8, out=None):
+        if np is None:
+            raise ImportError('Observer requires numpy')
+        self.k = k
+        self.size = np.array(size, dtype=np.float64)
+        self.half = self.size / 2
+        if out is None:
+            out = np.zeros(observation_size(k), dtype=np.float32)
+        self.obs = out
+        self._ship = out[:SHIP_FEATURES]
+        self._near = out[SHIP_FEATURES:].reshape(k, ASTEROID_FEATURES)
+        self._capacity = 0
+        self._grow(64)
+
+    def _grow(self, capacity):
+        # one row per asteroid in the layout of ASTEROID_FEATURES, so the
+        # nearest ones are copied out with a single gather
+        self._rows = np.ones((capacity, ASTEROID_FEATURES))
+        self._dist = np.empty(capacity)
+        self._capacity = capacity
+
+    def observe(self, game):
+        ship = game.starship
+        self._ship[:] = (*ship.pos, *ship.velocity, *ship.direction, ship.alive)
+
+        positions, velocities, radii = game._asteroid_motion()
+        n = len(radii)
+        if n > self._capacity:
+            self._grow(max(n, self._capacity * 2))
+        rows, dist = self._rows[:n], self._dist[:n]
+        pos = rows[:, 0:2]
+        _fill(pos, positions)
+        _fill(rows[:, 2:4], velocities)
+        rows[:, 4] = radii
+
+        # shortest offset from the ship, wrapping around the screen
+        pos -= (ship.pos.x, ship.pos.y)
+        pos += self.half
+        np.mod(pos, self.size, out=pos)
+        pos -= self.half
+        np.einsum('ij,ij->i', pos, pos, out=dist)
+
+        near = self._near
+        near[:] = 0
+        k = min(self.k, n)
+        if k:
+            nearest = np.argpartition(dist, k - 1)[:k] if n > k else np.arange(n)
+            # column 5, present, is always 1 in rows
+            near[:k] = rows[nearest[np.argsort(dist[nearest])]]
+        return self.obs
+
+
+class VectorEnv:
+    """
+    Steps n headless games in lockstep for training and evaluating agents.
+
+    reset() and step(actions) return the (n, observation_size(k)) float32
+    observation matrix, one row per game, which is the same array every time.
+    actions holds one row of (turn, thrust, fire) per game. step() also
+    returns rewards (asteroid hits this step), dones and a list of infos;
+    a finished game is restarted with the next seed straight away, so its
+    row then holds the first observation of the new game and its info the
+    result of the old one.
+
+    The games share the process-wide RNG; each keeps its own RNG state,
+    which is swapped in around its step, so every game plays exactly as it
+    would alone from its seed.
+    """
+
+    def __init__(self, n, k=8, seed=0, max_ticks=7200, entities='objects',
+                 **kwargs):
+        from game import MeteorDerby, ArrayDerby
+        if np is None:
+            raise ImportError('VectorEnv requires numpy')
+        cls = ArrayDerby if entities == 'arrays' else MeteorDerby
+        self.games = [cls(headless=True, **kwargs) for _ in range(n)]
+        self.obs = np.zeros((n, observation_size(k)), dtype=np.float32)
+        self.observers = [Observer(game.screen.get_size(), k, self.obs[i])
+                          for i, game in enumerate(self.games)]
+        self.rewards = np.zeros(n, dtype=np.float32)
+        self.dones = np.zeros(n, dtype=np.bool_)
+        self.max_ticks = max_ticks
+        self._seed = seed
+        self._states = [None] * n
+
+    def __len__(self):
+        return len(self.games)
+
+    def _restart(self, i):
+        game = self.games[i]
+        game.seed = self._seed
+        self._seed += 1
+        game._start()
+        self._states[i] = rng.getstate()
+        self.observers[i].observe(game)
+
+    def reset(self):
+        for i in range(len(self.games)):
+            self._restart(i)
+        return self.obs
+
+    def step(self, actions):
+        infos = []
+        for i, (game, action) in enumerate(zip(self.games, actions)):
+            rng.setstate(self._states[i])
+            shots = game.shots_status
+            turn, thrust, fire = action
+            game.step(Controls(int(turn), bool(thrust), int(fire)))
+            self.rewards[i] = shots - game.shots_status
+            done = game.game_over or game.ticks >= self.max_ticks
+            self.dones[i] = done
+            if done:
+                infos.append({'seed': game.seed, 'ticks': game.ticks,
+                              'won': game.game_over and game.starship.alive})
+                self._restart(i)
+            else:
+                self._states[i] = rng.getstate()
+                self.observers[i].observe(game)
+                infos.append({})
+        return self.obs, self.rewards, self.dones, infos
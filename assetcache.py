@@ -0,0 +1,133 @@
+import json
+import mmap
+import os
+import struct
+import pygame
+
+MAGIC = b'MDAC'
+VERSION = 1
+# magic, format version, length of the JSON index that follows
+HEADER = struct.Struct('<4sHI')
+
+
+def _image_key(path, size, alpha):
+    size = 'orig' if size is None else '%dx%d' % tuple(size)
+    return 'image:%s:%s:%s' % (path, size, 'alpha' if alpha else 'opaque')
+
+
+def _sheet_key(path, dimensions, scale):
+    scale = 'orig' if scale is None else '%dx%d' % tuple(scale)
+    return 'sheet:%s:%dx%d:%s' % (path, *dimensions, scale)
+
+
+class BakedAssets:
+    """
+    Prebaked raw-pixel cache of scaled images and sliced sprite sheets.
+
+    The file holds a small JSON index followed by the uncompressed pixels of
+    every surface, and is memory-mapped on open, so loading an asset is a
+    pygame.image.frombuffer() plus a display conversion instead of a PNG
+    decode and smoothscale. Entries record the mtime of their source file
+    and are ignored once it changes; the target size is part of the key.
+    """
+
+    def __init__(self, path='assets.cache'):
+        self.path = path
+        self._index = {}
+        self._data = None
+        self._base = 0
+        self._open()
+
+    def _open(self):
+        try:
+            f = open(self.path, 'rb')
+        except OSError:
+            return
+        with f:
+            try:
+                magic, version, length = HEADER.unpack(f.read(HEADER.size))
+            except struct.error:
+                return
+            if magic != MAGIC or version != VERSION:
+                return
+            self._index = json.loads(f.read(length))
+            self._base = HEADER.size + length
+            self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return len(self._index)
+
+    def _frames(self, key, alpha):
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        try:
+            if os.path.getmtime(entry['source']) != entry['mtime']:
+                return None
+        except OSError:
+            return None
+
+        fmt = entry['format']
+        view = memoryview(self._data)
+        frames = []
+        for offset, w, h in entry['frames']:
+            start = self._base + offset
+            pixels = view[start:start + w * h * len(fmt)]
+            image = pygame.image.frombuffer(pixels, (w, h), fmt)
+            frames.append(image.convert_alpha() if alpha else image.convert())
+        return frames
+
+    def image(self, path, size=None, alpha=True):
+        frames = self._frames(_image_key(path, size, alpha), alpha)
+        return None if frames is None else frames[0]
+
+    def sheet(self, path, dimensions, scale=None):
+        return self._frames(_sheet_key(path, dimensions, scale), True)
+
+    @staticmethod
+    def bake(registry, path='assets.cache'):
+        """
+        Write every image and sheet held by registry (an AssetRegistry) to
+        path. Full-size images that were only loaded to be scaled or sliced
+        are left out. Returns the number of entries written.
+        """
+        entries = []
+        derived = set()
+        for key, asset in registry.items():
+            kind, source = key[0], key[1]
+            if kind == 'image':
+                _, _, size, alpha = key
+                if size is not None:
+                    derived.add(source)
+                entries.append((source, _image_key(source, size, alpha),
+                                [asset], 'RGBA' if alpha else 'RGB'))
+            elif kind == 'sheet':
+                _, _, dimensions, scale = key
+                derived.add(source)
+                entries.append((source, _sheet_key(source, dimensions, scale),
+                                asset, 'RGBA'))
+
+        index = {}
+        blobs = []
+        offset = 0
+        for source, key, frames, fmt in entries:
+            if key.startswith('image:%s:orig:' % source) and source in derived:
+                continue
+            records = []
+            for frame in frames:
+                pixels = pygame.image.tobytes(frame, fmt)
+                records.append((offset, *frame.get_size()))
+                blobs.append(pixels)
+                offset += len(pixels)
+            index[key] = {'source': source, 'mtime': os.path.getmtime(source),
+                          'format': fmt, 'frames': records}
+
+        header = json.dumps(index).encode()
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, len(header)))
+            f.write(header)
+            for pixels in blobs:
+                f.write(pixels)
+        os.replace(tmp, path)
+        return len(index)
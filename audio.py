@@ -0,0 +1,139 @@
+import queue
+import threading
+import pygame
+
+from utils import assets
+
+
+class Cue:
+    """A sound that can be triggered from the simulation; see AudioManager."""
+    __slots__ = ('manager', 'path')
+
+    def __init__(self, manager, path):
+        self.manager = manager
+        self.path = path
+
+    def play(self):
+        self.manager.play(self.path)
+
+
+class AudioManager:
+    """
+    Sound dispatch kept off the simulation path.
+
+    play() only notes that a sound was triggered this frame, so triggering
+    the same sound many times in a frame (rapid fire) plays it once. flush(),
+    once per rendered frame, looks the frame's sounds up in the asset
+    registry and hands them to a background thread that only does the mixer
+    calls. Every sound has a cap on the voices playing it at once; a sound
+    with reserved channels gets that many channels of its own, and a new
+    trigger cuts off its oldest voice when they are all busy, while other
+    sounds share the remaining channels and are dropped at their cap. Until open() (and after close()) nothing is played or queued, which
+    is the no-audio mode of headless runs.
+    """
+
+    def __init__(self):
+        self._limits = {}
+        self._reserved = {}
+        self._voices = {}
+        self._pending = set()
+        self._queue = None
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return self._queue is not None
+
+    def configure(self, path, voices=4, reserve=False):
+        """
+        Let path play on at most voices channels at once; with reserve,
+        those channels are set aside for it.
+        """
+        self._limits[path] = (voices, reserve)
+        if self.enabled:
+            self._reserve()
+
+    def cue(self, path):
+        return Cue(self, path)
+
+    def open(self, frequency=44100, buffer=512, channels=16):
+        """Initialize the mixer and start dispatching sounds."""
+        if self.enabled:
+            return
+        # sounds cached while the mixer was off are silent stand-ins
+        assets.clear('sound')
+        pygame.mixer.init(frequency=frequency, buffer=buffer)
+        pygame.mixer.set_num_channels(channels)
+        self._reserve()
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='audio',
+                                        daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """Stop dispatching, then shut the mixer down."""
+        if self.enabled:
+            self._queue.put(None)
+            self._thread.join()
+            self._queue = self._thread = None
+        self._pending.clear()
+        self._voices.clear()
+        # cached Sounds die with the mixer
+        assets.clear('sound')
+        pygame.mixer.quit()
+
+    def _reserve(self):
+        # the first channels are taken out of the shared pool and split
+        # between the sounds that reserve them
+        self._reserved.clear()
+        first = 0
+        for path, (voices, reserve) in self._limits.items():
+            if reserve:
+                self._reserved[path] = [pygame.mixer.Channel(i) for i in
+                                        range(first, first + voices)]
+                first += voices
+        pygame.mixer.set_reserved(first)
+
+    def play(self, path):
+        if self._queue is not None:
+            self._pending.add(path)
+
+    def flush(self):
+        if self._pending:
+            # the registry is only used from this thread; close() may clear
+            # it while the audio thread is busy
+            self._queue.put([(path, assets.sound(path))
+                             for path in self._pending])
+            self._pending.clear()
+
+    def _run(self):
+        while True:
+            sounds = self._queue.get()
+            if sounds is None:
+                return
+            for path, sound in sounds:
+                self._dispatch(path, sound)
+
+    def _dispatch(self, path, sound):
+        voices, _ = self._limits.get(path, (None, False))
+        reserved = self._reserved.get(path)
+        if reserved is not None:
+            # idle channel if there is one, otherwise the oldest voice
+            channel = next((channel for channel in reserved
+                            if not channel.get_busy()), reserved[0])
+            reserved.remove(channel)
+            reserved.append(channel)
+            channel.play(sound)
+            return
+
+        playing = [channel for channel in self._voices.get(path, ())
+                   if channel.get_busy() and channel.get_sound() is sound]
+        if voices is not None and len(playing) >= voices:
+            return
+        channel = sound.play()
+        if channel is not None:
+            playing.append(channel)
+        self._voices[path] = playing
+
+
+audio = AudioManager()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+"""
+Run many headless games across all cores, e.g. to compare tunings:
+
+    python batch.py --games 500 --policy turret \\
+        --set Asteroid.max_speed=1.5,2,3 --output results.jsonl
+
+Every game gets its own seed (--seed, --seed + 1, ...; the same seeds are used
+for every combination of --set values, so they are compared on the same
+games) and is played by a policy: either a function called with the game
+before every step that returns the step's Controls, or an agents.Controller
+class, which plays through the game's controller hook. Built-in policies are
+idle, spinner and turret (agents.TurretController); any other is given as
+module:name and must be importable by the worker processes.
+
+--set NAME=V1[,V2...] overrides a class attribute of models (for example
+Asteroid.max_speed, Asteroid.max_spin, Asteroid.pieces, Starship.acceleration,
+Starship.bullet_speed) for the games it applies to.
+
+One JSON line per game is written to --output as games finish; a summary per
+combination is printed at the end.
+"""
+
+import argparse
+import importlib
+import itertools
+import json
+import multiprocessing
+import os
+import statistics
+import time
+
+import models
+from agents import Controller, TurretController
+from controls import Controls, IDLE
+
+POLICIES = {}
+
+
+def policy(func):
+    POLICIES[func.__name__] = func
+    return func
+
+
+@policy
+def idle(game):
+    return IDLE
+
+
+@policy
+def spinner(game):
+    """Turn in place and fire every eighth tick."""
+    return Controls(turn=1, fire=int(game.ticks % 8 == 0))
+
+
+# turn toward the nearest asteroid (across the wrap) and fire at it
+POLICIES['turret'] = TurretController
+
+
+def load_policy(name):
+    if name in POLICIES:
+        return POLICIES[name]
+    module, _, func = name.partition(':')
+    return getattr(importlib.import_module(module), func)
+
+
+def _apply(settings):
+    """Set the models class attributes in settings; returns the old values."""
+    previous = {}
+    for name, value in settings.items():
+        cls, attr = name.split('.')
+        target = getattr(models, cls)
+        previous[name] = getattr(target, attr)
+        setattr(target, attr, value)
+    return previous
+
+
+# one game per worker process and entity model, reused for every job
+_games = {}
+
+
+def _game(entities, asset_cache):
+    game = _games.get(entities)
+    if game is None:
+        from game import MeteorDerby, ArrayDerby
+        cls = ArrayDerby if entities == 'arrays' else MeteorDerby
+        game = _games[entities] = cls(headless=True, asset_cache=asset_cache)
+    return game
+
+
+def run_game(job):
+    """
+    Play one game as described by job (a dict of seed, policy, ticks,
+    entities, asset_cache and settings) and return its result.
+    """
+    game = _game(job.get('entities', 'objects'),
+                 job.get('asset_cache', 'assets.cache'))
+    play = load_policy(job.get('policy', 'turret'))
+    controller = None
+    if isinstance(play, type) and issubclass(play, Controller):
+        controller, play = play(), None
+    settings = job.get('settings', {})
+    previous = _apply(settings)
+    try:
+        game.set_controller(controller)
+        game.seed = job['seed']
+        game._start()
+        shots = 0
+        lost_at = None
+        start = time.perf_counter()
+        for _ in range(job.get('ticks', 7200)):
+            if game.game_over:
+                break
+            alive = game.starship.alive
+            game.step(None if play is None else play(game))
+            if alive:
+                shots += game.controls.fire
+            if lost_at is None and not game.starship.alive:
+                lost_at = game.ticks
+        elapsed = time.perf_counter() - start
+    finally:
+        game.set_controller(None)
+        _apply(previous)
+
+    won = game.game_over and game.starship.alive
+    return {
+        'seed': job['seed'],
+        'settings': settings,
+        'result': 'won' if won else 'lost' if lost_at else 'timeout',
+        'ticks': game.ticks,
+        'survival': (game.ticks if lost_at is None else lost_at) / game.tick_rate,
+        'shots_fired': shots,
+        'shots_left': game.shots_status,
+        'ticks_per_sec': round(game.ticks / elapsed) if elapsed else None,
+    }
+
+
+def jobs(games, seed=0, settings=None, **job):
+    """
+    Yield a job per game and combination of settings, where settings maps
+    attribute names to lists of values.
+    """
+    settings = settings or {}
+    names = sorted(settings)
+    for values in itertools.product(*(settings[name] for name in names)):
+        for i in range(games):
+            yield dict(job, seed=seed + i, settings=dict(zip(names, values)))
+
+
+def summarize(results):
+    groups = {}
+    for result in results:
+        key = json.dumps(result['settings'], sort_keys=True)
+        groups.setdefault(key, []).append(result)
+    summary = []
+    for key, group in groups.items():
+        survival = [result['survival'] for result in group]
+        summary.append({
+            'settings': json.loads(key),
+            'games': len(group),
+            'win_rate': sum(r['result'] == 'won' for r in group) / len(group),
+            'loss_rate': sum(r['result'] == 'lost' for r in group) / len(group),
+            'survival_mean': round(statistics.fmean(survival), 2),
+            'survival_median': round(statistics.median(survival), 2),
+            'shots_fired_mean': round(statistics.fmean(
+                r['shots_fired'] for r in group), 1),
+        })
+    return summary
+
+
+def run(job_list, processes=None, output=None, chunksize=4):
+    """
+    Run every job on a pool of processes (all cores by default), appending
+    each result to output as a JSON line as soon as it arrives. Returns the
+    results in completion order.
+    """
+    results = []
+    out = open(output, 'w') if output else None
+    # workers are closed and joined rather than terminated: SDL handles
+    # SIGTERM itself, so a terminated worker would never exit
+    pool = multiprocessing.Pool(processes)
+    try:
+        for result in pool.imap_unordered(run_game, job_list, chunksize):
+            results.append(result)
+            if out is not None:
+                out.write(json.dumps(result) + '\n')
+                out.flush()
+    finally:
+        pool.close()
+        pool.join()
+        if out is not None:
+            out.close()
+    return results
+
+
+def _setting(text):
+    name, _, values = text.partition('=')
+    if not values or name.count('.') != 1:
+        raise argparse.ArgumentTypeError('expected Class.attribute=V1[,V2...]')
+    return name, [json.loads(value) for value in values.split(',')]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__.split('\n\n')[0].strip())
+    parser.add_argument('--games', type=int, default=100,
+                        help='games per combination of settings')
+    parser.add_argument('--ticks', type=int, default=7200,
+                        help='steps after which a game is a timeout')
+    parser.add_argument('--seed', type=int, default=0, help='first seed')
+    parser.add_argument('--policy', default='turret',
+                        help='%s or module:name' % ', '.join(sorted(POLICIES)))
+    parser.add_argument('--entities', choices=('objects', 'arrays'),
+                        default='objects')
+    parser.add_argument('--set', type=_setting, action='append', default=[],
+                        metavar='NAME=V1[,V2...]', dest='settings')
+    parser.add_argument('--processes', type=int,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--asset-cache', default='assets.cache', metavar='PATH')
+    parser.add_argument('--output', metavar='PATH',
+                        help='stream one JSON line per game to PATH')
+    args = parser.parse_args()
+    load_policy(args.policy)
+
+    job_list = list(jobs(args.games, args.seed, dict(args.settings),
+                         policy=args.policy, ticks=args.ticks,
+                         entities=args.entities, asset_cache=args.asset_cache))
+    start = time.perf_counter()
+    results = run(job_list, args.processes, args.output)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({
+        'games': len(results),
+        'processes': args.processes or os.cpu_count(),
+        'seconds': round(elapsed, 2),
+        'games_per_sec': round(len(results) / elapsed, 2),
+        'ticks_per_sec': round(sum(r['ticks'] for r in results) / elapsed),
+        'summary': summarize(results),
+    }, indent=2))
@@ -0,0 +1,387 @@
+#!/usr/bin/env python
+"""
+Benchmarks for MeteorDerby. Everything runs under the SDL dummy video and
+audio drivers, so no window is opened.
+
+    python benchmark.py objects    memory per entity and attribute access
+                                   cost, against a __dict__ baseline
+    python benchmark.py [SCENARIO ...] [--ticks N] [--output PATH]
+                                   frame-time percentiles of the stress
+                                   scenarios (all of them by default)
+
+Scenarios run a headless game for a fixed number of ticks and time the
+input, update, collision, commands (applying the tick's spawns and kills)
+and draw phases of every tick separately; results
+are JSON, so runs from different commits can be compared directly.
+
+    asteroids   --count big asteroids drifting across the screen
+    fire        the ship spins and fires --fire-rate bullets per second into
+                a field kept topped up to --count asteroids
+    cascade     waves of --count big asteroids split all the way down
+    edges       --count asteroids sliding along the wrap edges, so each one
+                straddles the border for the whole run
+"""
+
+import argparse
+import copy
+import json
+import os
+import platform
+import subprocess
+import time
+import timeit
+import tracemalloc
+
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+from pygame.math import Vector2
+from pygame.sprite import Group, Sprite
+
+from models import Asteroid, Bullet, MirroredGameObject, Starship
+from game import MeteorDerby, ArrayDerby
+from controls import Controls, IDLE
+
+PHASES = ('input', 'update', 'collision', 'commands', 'draw')
+
+
+def _screen():
+    if not pygame.display.get_init() or pygame.display.get_surface() is None:
+        pygame.init()
+        pygame.display.set_mode((1024, 768))
+    return pygame.display.get_surface()
+
+
+def _bytes_per_object(create, count):
+    # a first round warms up class-level caches (images, rotations, masks)
+    create(1)
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    objects = create(count)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return (after - before) / count
+
+
+class _DictSprite(Sprite):
+    """Baseline: the same attributes kept in the instance __dict__."""
+
+
+class _ForwardingMirror(_DictSprite):
+    """Baseline mirror handing unknown attributes on to its master."""
+
+    def __getattr__(self, name):
+        return getattr(self.master, name)
+
+
+def _slot_names(obj):
+    return [name for cls in type(obj).__mro__
+            for name in getattr(cls, '__slots__', ()) if hasattr(obj, name)]
+
+
+def _dict_twin(obj, cls=_DictSprite):
+    # shares obj's attribute values, so only the layout differs from a
+    # shallow copy of obj
+    twin = cls.__new__(cls)
+    twin.__dict__.update(obj.__dict__)
+    for name in _slot_names(obj):
+        twin.__dict__[name] = getattr(obj, name)
+    return twin
+
+
+def _layout_bytes(objects, make):
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    copies = [make(obj) for obj in objects]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del copies
+    return round((after - before) / len(objects))
+
+
+def bench_objects(count=2000, loops=200000):
+    """
+    Measure the memory cost of an asteroid (with its mirror copies) and of a
+    bullet, and the time of hot attribute accesses on objects and mirrors.
+
+    The same run measures a __dict__ baseline: for layout_bytes, every object
+    is shallow-copied as it is (slots) and into a plain Sprite holding the
+    same attributes in its __dict__, so only the storage differs. The access
+    baseline reads the same attributes from such twins, with mirrors
+    forwarding to their master through __getattr__. pygame's Sprite gives
+    every object a __dict__ anyway and instance dicts share their keys, so
+    slots save little or no memory on a GameObject itself; the gains are in
+    the mirrors and in attribute access.
+    """
+    screen = _screen()
+    MirroredGameObject.wrap_mode = 'mirrors'
+
+    def asteroids(n):
+        group = Group()
+        return [Asteroid(screen, Vector2(100, 100), Vector2(1, 1), 'big',
+                         [group]) for _ in range(n)]
+
+    def bullets(n):
+        group = Group()
+        return [Bullet(screen, Vector2(100, 100), Vector2(0, -8), [group])
+                for _ in range(n)]
+
+    asteroid = asteroids(1)[0]
+    mirror = next(sprite for sprite in asteroid.mirrors
+                  if sprite is not asteroid)
+    bullet = bullets(1)[0]
+    accesses = {
+        'asteroid.pos': lambda: asteroid.pos,
+        'asteroid.velocity': lambda: asteroid.velocity,
+        'asteroid.mask': lambda: asteroid.mask,
+        'bullet.rect': lambda: bullet.rect,
+        'mirror.size': lambda: mirror.size,
+        'mirror.mask': lambda: mirror.mask,
+        'mirror.rect': lambda: mirror.rect,
+    }
+    asteroid_twin = _dict_twin(asteroid)
+    mirror_twin = _dict_twin(mirror, _ForwardingMirror)
+    mirror_twin.master = asteroid_twin
+    bullet_twin = _dict_twin(bullet)
+    baseline = {
+        'asteroid.pos': lambda: asteroid_twin.pos,
+        'asteroid.velocity': lambda: asteroid_twin.velocity,
+        'bullet.rect': lambda: bullet_twin.rect,
+        'mirror.size': lambda: mirror_twin.size,
+    }
+
+    def ns(access):
+        return round(timeit.timeit(access, number=loops) / loops * 1e9, 1)
+
+    samples = {'asteroid': asteroids(count), 'bullet': bullets(count)}
+    samples['mirror'] = [sprite for master in samples['asteroid']
+                         for sprite in master.mirrors if sprite is not master]
+    return {
+        'bytes_per_asteroid': round(_bytes_per_object(asteroids, count)),
+        'bytes_per_bullet': round(_bytes_per_object(bullets, count)),
+        'layout_bytes': {name: {'slots': _layout_bytes(objects, copy.copy),
+                                'dict': _layout_bytes(objects, _dict_twin)}
+                         for name, objects in samples.items()},
+        'ns_per_access': {name: ns(access)
+                          for name, access in accesses.items()},
+        'ns_per_access_dict': {name: ns(access)
+                               for name, access in baseline.items()},
+    }
+
+
+class _Stress:
+    """
+    Keeps the ship in play whatever hits it, so that a scenario's load does
+    not end with the game.
+    """
+
+    def _ship_hit(self, ship, asteroid):
+        pass
+
+
+class StressDerby(_Stress, MeteorDerby):
+    pass
+
+
+class StressArrayDerby(_Stress, ArrayDerby):
+    pass
+
+
+def _asteroid_count(game):
+    return len(game._asteroid_bodies()[0])
+
+
+def scenario_asteroids(game, count=500, fire_rate=None):
+    for _ in range(count):
+        game._spawn_asteroid()
+    return lambda tick: IDLE
+
+
+def scenario_fire(game, count=50, fire_rate=600):
+    per_tick = fire_rate / game.tick_rate
+
+    def script(tick):
+        for _ in range(count - _asteroid_count(game)):
+            game._spawn_asteroid()
+        fire = int((tick + 1) * per_tick) - int(tick * per_tick)
+        return Controls(turn=1, fire=fire)
+    return script
+
+
+def _drop_bullet(game, pos):
+    velocity = Vector2(0, -Starship.bullet_speed)
+    if isinstance(game, ArrayDerby):
+        game.world.spawn_bullet(pos, velocity, [game.bullets])
+    else:
+        Bullet.spawn(game.screen, pos, velocity, [game.bullets])
+
+
+def scenario_cascade(game, count=40, fire_rate=None, interval=4):
+    # a bullet is dropped on every asteroid each tick, so a wave splits
+    # big -> medium -> small -> nothing in three ticks (more once the spawn
+    # budget spreads the pieces out), all of it in the collision and
+    # commands phases
+    def script(tick):
+        if tick % interval == 0:
+            for _ in range(count):
+                game._spawn_asteroid()
+        for asteroid in game._asteroid_bodies()[0]:
+            _drop_bullet(game, Vector2(asteroid.rect.center))
+        return IDLE
+    return script
+
+
+def scenario_edges(game, count=200, fire_rate=None):
+    w, h = game.screen.get_size()
+    for i in range(count):
+        side, t = i % 4, (i // 4 * 4 + 1) / count
+        speed = 1.0 + i % 3
+        if side == 0:
+            pos, velocity = (t * w, 0), (speed, 0)
+        elif side == 1:
+            pos, velocity = (t * w, h), (-speed, 0)
+        elif side == 2:
+            pos, velocity = (0, t * h), (0, speed)
+        else:
+            pos, velocity = (w, t * h), (0, -speed)
+        game._spawn_asteroid(Vector2(pos), Vector2(velocity),
+                             ('small', 'medium', 'big')[i % 3])
+    return lambda tick: IDLE
+
+
+SCENARIOS = {
+    'asteroids': scenario_asteroids,
+    'fire': scenario_fire,
+    'cascade': scenario_cascade,
+    'edges': scenario_edges,
+}
+
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    return {'p%d' % q: round(samples[min(len(samples) - 1,
+                                          len(samples) * q // 100)] * 1e3, 3)
+            for q in (50, 95, 99)}
+
+
+def bench_scenario(name, ticks=600, warmup=60, entities='objects',
+                   wrap_mode='mirrors', broad_phase=None, render_mode='full',
+                   seed=1, **params):
+    """
+    Run scenario name for warmup + ticks steps and report per-phase frame
+    times (milliseconds, over the last ticks steps) and entities per second.
+    params (count, fire_rate) override the scenario's defaults.
+    """
+    kwargs = dict(headless=True, render_mode=render_mode, seed=seed)
+    if broad_phase is not None:
+        kwargs['broad_phase'] = broad_phase
+    if entities == 'arrays':
+        game = StressArrayDerby(**kwargs)
+    else:
+        game = StressDerby(wrap_mode=wrap_mode, **kwargs)
+    game._start()
+    for asteroid in list(game._asteroid_bodies()[0]):
+        asteroid.kill()
+    game.shots_status = game._shots_left()
+    params = {key: value for key, value in params.items() if value is not None}
+    script = SCENARIOS[name](game, **params)
+
+    times = {phase: [] for phase in PHASES + ('frame',)}
+    clock = time.perf_counter
+    population = 0
+    for tick in range(warmup + ticks):
+        controls = script(tick)
+        t0 = clock()
+        game._apply_controls(controls)
+        t1 = clock()
+        game.ticks += 1
+        game._update_objects()
+        t2 = clock()
+        game._collide()
+        t3 = clock()
+        game._apply_commands()
+        t4 = clock()
+        game._draw()
+        t5 = clock()
+        if tick < warmup:
+            continue
+        for phase, start, end in zip(PHASES, (t0, t1, t2, t3, t4),
+                                     (t1, t2, t3, t4, t5)):
+            times[phase].append(end - start)
+        times['frame'].append(t5 - t0)
+        population += _asteroid_count(game) + len(game.bullets) + 1
+
+    total = sum(times['frame'])
+    return {
+        'config': {'entities': entities, 'wrap_mode': game.wrap_mode,
+                   'broad_phase': game.broad_phase, 'render_mode': render_mode,
+                   'ticks': ticks, 'warmup': warmup, 'seed': seed,
+                   **params},
+        'mean_entities': round(population / ticks, 1),
+        'entities_per_sec': round(population / total),
+        'fps': round(ticks / total, 1),
+        'ms': {phase: _percentiles(samples)
+               for phase, samples in times.items()},
+    }
+
+
+def _environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))
+                                ).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'pygame': pygame.version.ver, 'machine': platform.machine()}
+
+
+BENCHMARKS = {
+    'objects': bench_objects,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', nargs='*',
+                        help='one of %s' % ', '.join(
+                            sorted(BENCHMARKS) + sorted(SCENARIOS)))
+    parser.add_argument('--ticks', type=int, default=600)
+    parser.add_argument('--warmup', type=int, default=60)
+    parser.add_argument('--count', type=int,
+                        help='asteroids in the scenario (per wave for cascade)')
+    parser.add_argument('--fire-rate', type=int, help='bullets per second')
+    parser.add_argument('--entities', choices=['objects', 'arrays'],
+                        default='objects')
+    parser.add_argument('--wrap', choices=['mirrors', 'torus'],
+                        default='mirrors')
+    parser.add_argument('--broad-phase', choices=['grid', 'circles'])
+    parser.add_argument('--render', choices=['full', 'dirty'], default='full')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', metavar='PATH',
+                        help='write the JSON report to PATH as well')
+    args = parser.parse_args()
+
+    names = args.benchmark or sorted(SCENARIOS)
+    unknown = set(names) - set(BENCHMARKS) - set(SCENARIOS)
+    if unknown:
+        parser.error('unknown benchmark: %s' % ', '.join(sorted(unknown)))
+
+    results = {}
+    for name in names:
+        if name in BENCHMARKS:
+            results[name] = BENCHMARKS[name]()
+        else:
+            results[name] = bench_scenario(
+                name, args.ticks, args.warmup, args.entities, args.wrap,
+                args.broad_phase, args.render, args.seed, count=args.count,
+                fire_rate=args.fire_rate)
+    report = {'environment': _environment(), 'results': results}
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
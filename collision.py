@@ -0,0 +1,139 @@
+from collections import defaultdict
+from pygame.sprite import collide_mask
+
+try:
+    import numpy as np
+except ImportError:  # only needed for circle_pairs
+    np = None
+
+
+class SpatialHash:
+    """
+    Uniform grid broad phase over a toroidal playfield.
+
+    Sprites are bucketed by the cells their rect covers; cell coordinates wrap
+    around the playfield so a rect hanging off one edge lands in the cells on
+    the opposite side as well. Rebuild it once per tick with build().
+    """
+
+    def __init__(self, size, cell_size=128):
+        self.width, self.height = size
+        self.cell_size = cell_size
+        self.cols = max(1, -(-self.width // cell_size))
+        self.rows = max(1, -(-self.height // cell_size))
+        self._cells = defaultdict(list)
+
+    def _cells_for(self, rect):
+        cs = self.cell_size
+        cols, rows = self.cols, self.rows
+        x0, x1 = rect.left // cs, (rect.right - 1) // cs
+        y0, y1 = rect.top // cs, (rect.bottom - 1) // cs
+        # a rect wider than the playfield covers every column exactly once
+        xs = range(cols) if x1 - x0 >= cols else range(x0, x1 + 1)
+        ys = range(rows) if y1 - y0 >= rows else range(y0, y1 + 1)
+        for cy in ys:
+            for cx in xs:
+                yield cx % cols, cy % rows
+
+    def clear(self):
+        self._cells.clear()
+
+    def insert(self, sprite, rect=None):
+        rect = sprite.rect if rect is None else rect
+        for cell in self._cells_for(rect):
+            self._cells[cell].append(sprite)
+
+    def build(self, sprites):
+        self.clear()
+        for sprite in sprites:
+            self.insert(sprite)
+
+    def query(self, rect):
+        # dict keeps insertion order, so results are deterministic
+        candidates = {}
+        cells = self._cells
+        for cell in self._cells_for(rect):
+            bucket = cells.get(cell)
+            if bucket:
+                candidates.update(dict.fromkeys(bucket))
+        return candidates.keys()
+
+    def collisions(self, sprite, collided=None):
+        """
+        Return live sprites in the grid that collide with sprite. collided
+        defaults to collide_rect_mask.
+        """
+        collided = collide_rect_mask if collided is None else collided
+        return [other for other in self.query(sprite.rect)
+                if other.alive() and collided(sprite, other)]
+
+
+def collide_rect_mask(left, right):
+    return left.rect.colliderect(right.rect) and collide_mask(left, right)
+
+
+class TorusCollider:
+    """
+    Rect + mask collision test on a torus of the given size.
+
+    Instead of testing against mirror copies, right is moved to its minimum
+    image relative to left (the nearest of its wrapped positions) and the
+    pair is tested once.
+    """
+
+    def __init__(self, size):
+        self.width, self.height = size
+
+    def offset(self, left, right):
+        w, h = self.width, self.height
+        lrect, rrect = left.rect, right.rect
+        dx = rrect.centerx - lrect.centerx
+        dy = rrect.centery - lrect.centery
+        dx = (dx + w // 2) % w - w // 2
+        dy = (dy + h // 2) % h - h // 2
+        # top-left of right's nearest image, relative to left's top-left
+        return (dx + lrect.width // 2 - rrect.width // 2,
+                dy + lrect.height // 2 - rrect.height // 2)
+
+    def __call__(self, left, right):
+        ox, oy = self.offset(left, right)
+        lrect, rrect = left.rect, right.rect
+        if (ox >= lrect.width or oy >= lrect.height or
+                ox <= -rrect.width or oy <= -rrect.height):
+            return False
+        return left.mask.overlap(right.mask, (ox, oy)) is not None
+
+
+def circle_pairs(pos_a, radius_a, pos_b, radius_b, size=None, chunk=1 << 18):
+    """
+    Return index arrays (i, j) of every pair whose bounding circles overlap.
+
+    pos_a, pos_b are (n, 2) arrays of centers, radius_a, radius_b the matching
+    radii. With size=(w, h) distances use the minimum image on that torus.
+    Rows of pos_a are processed in chunks so the temporary distance array
+    stays around chunk elements. Pairs come out ordered by i, then j.
+    """
+    pos_a = np.asarray(pos_a, dtype=np.float64).reshape(-1, 2)
+    pos_b = np.asarray(pos_b, dtype=np.float64).reshape(-1, 2)
+    radius_a = np.asarray(radius_a, dtype=np.float64)
+    radius_b = np.asarray(radius_b, dtype=np.float64)
+    if not len(pos_a) or not len(pos_b):
+        empty = np.empty(0, dtype=np.intp)
+        return empty, empty
+    bounds = None if size is None else np.asarray(size, dtype=np.float64)
+
+    rows = max(1, chunk // len(pos_b))
+    found_i, found_j = [], []
+    for start in range(0, len(pos_a), rows):
+        stop = start + rows
+        d = pos_b[None, :, :] - pos_a[start:stop, None, :]
+        if bounds is not None:
+            # only the magnitude matters: take the shorter way around
+            np.abs(d, out=d)
+            np.minimum(d, bounds - d, out=d)
+        dist2 = np.einsum('ijk,ijk->ij', d, d)
+        reach = radius_a[start:stop, None] + radius_b[None, :]
+        i, j = np.nonzero(dist2 <= reach * reach)
+        found_i.append(i + start)
+        found_j.append(j)
+    return np.concatenate(found_i), np.concatenate(found_j)
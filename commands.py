@@ -0,0 +1,62 @@
+from collections import deque
+
+
+class CommandBuffer:
+    """
+    Spawns and kills recorded while a tick's collisions run, carried out
+    together by apply() at the end of the tick, so that no group changes
+    while it is being iterated.
+
+    A killed sprite stays in its groups until apply(); killed() tells the
+    collision tests to skip it (a mirror copy counts as its master). At most
+    spawn_budget spawns are carried out per apply() (None for no limit); the
+    rest wait, in order, for the following ticks, which spreads a large
+    cascade of splits over several frames.
+    """
+
+    def __init__(self, spawn_budget=None):
+        self.spawn_budget = spawn_budget
+        # a dict rather than a set keeps the kills in the order they happened
+        self._kills = {}
+        self._spawns = deque()
+
+    def __len__(self):
+        return len(self._kills) + len(self._spawns)
+
+    @property
+    def spawns_pending(self):
+        return len(self._spawns)
+
+    def kill(self, sprite):
+        self._kills[getattr(sprite, 'master', sprite)] = None
+
+    def killed(self, sprite):
+        return getattr(sprite, 'master', sprite) in self._kills
+
+    def spawn(self, func, *args):
+        """Call func(*args) when the spawn comes up in apply()."""
+        self._spawns.append((func, args))
+
+    def spawns(self):
+        """The (func, args) of the spawns still waiting, in order."""
+        return list(self._spawns)
+
+    def apply(self):
+        """Carry out the spawns the budget allows, then every kill."""
+        # spawning first keeps the order objects are taken from the pools
+        # (and entity slots from the free list) what it was when a split
+        # spawned its pieces before its parent was killed
+        spawns = self._spawns
+        n = len(spawns)
+        if self.spawn_budget is not None:
+            n = min(n, self.spawn_budget)
+        for _ in range(n):
+            func, args = spawns.popleft()
+            func(*args)
+        kills, self._kills = self._kills, {}
+        for sprite in kills:
+            sprite.kill()
+
+    def clear(self):
+        self._kills.clear()
+        self._spawns.clear()
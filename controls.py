@@ -0,0 +1,23 @@
+from collections import namedtuple
+
+# Everything the player can do in one simulation step: turn is -1
+# (counterclockwise), 0 or 1 (clockwise), thrust a bool, fire the number of
+# shots and new_game whether a new game starts before the step.
+Controls = namedtuple('Controls', 'turn thrust fire new_game',
+                      defaults=(0, False, 0, False))
+
+IDLE = Controls()
+
+MAX_FIRE = 15
+
+
+def pack_controls(controls):
+    """Pack controls into a single byte (fire is capped at MAX_FIRE)."""
+    turn = {0: 0, 1: 1, -1: 2}[controls.turn]
+    return (turn | controls.thrust << 2 | controls.new_game << 3 |
+            min(controls.fire, MAX_FIRE) << 4)
+
+
+def unpack_controls(byte):
+    return Controls((0, 1, -1, 0)[byte & 3], bool(byte & 4), byte >> 4,
+                    bool(byte & 8))
@@ -0,0 +1,252 @@
+import math
+
+try:
+    import numpy as np
+except ImportError:  # only needed for the array-backed world
+    np = None
+
+from pygame import Rect
+from pygame.sprite import Sprite
+from models import Asteroid, Bullet, rotation_cache
+from utils import get_random_vel, get_random_spin
+
+ASTEROID = 0
+BULLET = 1
+SIZES = ('small', 'medium', 'big')
+SIZE_INDEX = {size: index for index, size in enumerate(SIZES)}
+
+
+class EntityWorld:
+    """
+    Structure-of-arrays store for asteroids and bullets.
+
+    Position, velocity, angle, spin, size class, bounding radius and the alive
+    flag live in contiguous NumPy arrays, so integration, wrapping and
+    off-screen culling are a handful of vectorized operations per tick.
+    Each live slot has an EntityView sprite that is only used for drawing
+    and collision tests.
+    """
+
+    def __init__(self, screen, capacity=256):
+        if np is None:
+            raise ImportError('EntityWorld requires numpy')
+        self.screen = screen
+        self.bounds = np.array(screen.get_size(), dtype=np.float64)
+        self.capacity = 0
+        self.count = 0  # high-water mark; slots past it have never been used
+        self._free = []
+        self.views = []
+        self.pos = self.vel = self.angle = self.spin = None
+        self.kind = self.size = self.radius = self.alive = None
+        # fraction of a tick the views are drawn behind the simulation; see
+        # MeteorDerby._interpolate
+        self.lag = 0.0
+        self._grow(capacity)
+
+        Asteroid._load_images()
+        Bullet._load_images()
+        self._radii = {(ASTEROID, size): self._radius_of(Asteroid._images[name])
+                       for size, name in enumerate(SIZES)}
+        self._radii[(BULLET, 0)] = self._radius_of(Bullet._images[None])
+
+    @staticmethod
+    def _radius_of(image):
+        return math.hypot(*image.get_size()) / 2
+
+    def _grow(self, capacity):
+        def resize(old, shape, dtype):
+            new = np.zeros(shape, dtype)
+            if old is not None:
+                new[:len(old)] = old
+            return new
+
+        self.pos = resize(self.pos, (capacity, 2), np.float64)
+        self.vel = resize(self.vel, (capacity, 2), np.float64)
+        self.angle = resize(self.angle, capacity, np.float64)
+        self.spin = resize(self.spin, capacity, np.float64)
+        self.kind = resize(self.kind, capacity, np.int8)
+        self.size = resize(self.size, capacity, np.int8)
+        self.radius = resize(self.radius, capacity, np.float64)
+        self.alive = resize(self.alive, capacity, np.bool_)
+        self.views.extend([None] * (capacity - self.capacity))
+        self.capacity = capacity
+
+    def spawn(self, kind, pos, velocity, angle=0.0, spin=0.0, size=0,
+              groups=()):
+        index = self._free.pop() if self._free else self.count
+        return self.place(index, kind, pos, velocity, angle, spin, size,
+                          groups)
+
+    def place(self, index, kind, pos, velocity, angle=0.0, spin=0.0, size=0,
+              groups=()):
+        """Put an entity in slot index, which must not be in use."""
+        while index >= self.capacity:
+            self._grow(self.capacity * 2)
+        self.count = max(self.count, index + 1)
+        self.pos[index] = pos
+        self.vel[index] = velocity
+        self.angle[index] = angle
+        self.spin[index] = spin
+        self.kind[index] = kind
+        self.size[index] = size
+        self.radius[index] = self._radii[(kind, size)]
+        self.alive[index] = True
+        self.views[index] = EntityView(self, index, groups)
+        return index
+
+    def spawn_asteroid(self, pos, velocity=None, size='big', groups=()):
+        if velocity is None:
+            velocity = get_random_vel(Asteroid.max_speed)
+        return self.spawn(ASTEROID, pos, velocity, 0.0,
+                          get_random_spin(Asteroid.max_spin), SIZE_INDEX[size],
+                          groups)
+
+    def spawn_bullet(self, pos, velocity, groups=()):
+        # same orientation rule as Bullet: the beam points along its velocity
+        angle = velocity.angle_to((0, -1))
+        return self.spawn(BULLET, pos, velocity, angle, 0.0, 0, groups)
+
+    def despawn(self, index):
+        if not self.alive[index]:
+            return
+        self.alive[index] = False
+        view, self.views[index] = self.views[index], None
+        self._free.append(index)
+        if view is not None:
+            Sprite.kill(view)
+
+    def entities(self):
+        """
+        Return (slot, kind, size, x, y, vx, vy, angle, spin) for every live
+        entity, in slot order.
+        """
+        n = self.count
+        live = np.flatnonzero(self.alive[:n])
+        return zip(live.tolist(), self.kind[live].tolist(),
+                   self.size[live].tolist(), *self.pos[live].T.tolist(),
+                   *self.vel[live].T.tolist(), self.angle[live].tolist(),
+                   self.spin[live].tolist())
+
+    @property
+    def free(self):
+        """The free slots, in the order spawn() will hand them out again."""
+        return list(reversed(self._free))
+
+    @free.setter
+    def free(self, slots):
+        self._free = list(reversed(slots))
+        if slots:
+            self.count = max(self.count, max(slots) + 1)
+
+    def bodies(self, kind):
+        """Return the live views of kind with their positions and radii."""
+        n = self.count
+        live = np.flatnonzero(self.alive[:n] & (self.kind[:n] == kind))
+        return [self.views[i] for i in live], self.pos[live], self.radius[live]
+
+    def motion(self, kind):
+        """Return the positions, velocities and radii of the live kind."""
+        n = self.count
+        live = np.flatnonzero(self.alive[:n] & (self.kind[:n] == kind))
+        return self.pos[live], self.vel[live], self.radius[live]
+
+    def shots_left(self):
+        n = self.count
+        live = self.alive[:n] & (self.kind[:n] == ASTEROID)
+        shots = [Asteroid.shots_for(size) for size in SIZES]
+        return int(np.take(shots, self.size[:n][live]).sum())
+
+    def step(self):
+        """
+        Advance every entity by one tick. Asteroids wrap around the screen,
+        bullets that have left it are despawned; returns their indices.
+        """
+        n = self.count
+        alive = self.alive[:n]
+        kind = self.kind[:n]
+        pos = self.pos[:n]
+        pos += self.vel[:n]
+        angle = self.angle[:n]
+        angle -= self.spin[:n]
+        np.mod(angle, 360.0, out=angle)
+
+        asteroids = alive & (kind == ASTEROID)
+        np.mod(pos, self.bounds, out=pos, where=asteroids[:, None])
+
+        w, h = self.bounds
+        r = self.radius[:n]
+        x, y = pos[:, 0], pos[:, 1]
+        gone = (alive & (kind == BULLET) &
+                ((x + r < 0) | (x - r > w) | (y + r < 0) | (y - r > h)))
+        culled = np.flatnonzero(gone)
+        for index in culled:
+            self.despawn(index)
+        return culled
+
+
+class EntityView(Sprite):
+    """Drawing-only sprite reading its state from an EntityWorld slot."""
+
+    def __init__(self, world, index, groups=()):
+        super().__init__(*groups)
+        self.world = world
+        self.index = index
+        if world.kind[index] == ASTEROID:
+            size = SIZES[world.size[index]]
+            self._key = (Asteroid, size)
+            self._source = Asteroid._images[size]
+        else:
+            self._key = (Bullet, None)
+            self._source = Bullet._images[None]
+        self._bucket = None
+        self._rotation = None
+        self._rect = Rect(0, 0, 0, 0)
+
+    def _rotated(self):
+        bucket = rotation_cache.bucket(self.world.angle[self.index])
+        if bucket != self._bucket:
+            self._rotation = rotation_cache.get(self._key, bucket, self._source)
+            self._bucket = bucket
+        return self._rotation
+
+    @property
+    def image(self):
+        return self._rotated().image
+
+    @property
+    def mask(self):
+        return self._rotated().mask
+
+    @property
+    def rect(self):
+        world = self.world
+        x, y = world.pos[self.index]
+        if world.lag:
+            vx, vy = world.vel[self.index]
+            x -= vx * world.lag
+            y -= vy * world.lag
+        self._rect.size = self._rotated().size
+        self._rect.center = (x, y)
+        return self._rect
+
+    @property
+    def pos(self):
+        return self.world.pos[self.index]
+
+    @property
+    def velocity(self):
+        return self.world.vel[self.index]
+
+    def visible(self, margin=0):
+        return True
+
+    @property
+    def size(self):
+        return SIZES[self.world.size[self.index]]
+
+    @property
+    def shots(self):
+        return Asteroid.shots_for(SIZES[self.world.size[self.index]])
+
+    def kill(self):
+        self.world.despawn(self.index)
@@ -1,63 +1,559 @@
+import os
+import random
+import sys
+import time
 import pygame
 from pygame.math import Vector2
 from pygame.sprite import Group, OrderedUpdates, LayeredUpdates
 import math
-from itertools import chain
+from itertools import chain, count
 
 # PYGAME RESOURCES
 
-from utils import print_text, load_and_scale
-from models import Starship, Asteroid, Bullet
+from utils import (print_text, draw_group, draw_visible, draw_wrapped,
+                   get_random_pos, assets, seed_rng, rng)
+import models
+from models import (Starship, Asteroid, Bullet, Explosion, GameObject,
+                    MirroredGameObject, rotation_cache, set_sprite_scale)
+from collision import (SpatialHash, TorusCollider, collide_rect_mask,
+                       circle_pairs)
+from entities import EntityWorld, ASTEROID, BULLET
+from assetcache import BakedAssets
+from commands import CommandBuffer
+import snapshot
+from controls import Controls, IDLE, MAX_FIRE
+from replay import Recorder, Replay
+from profiler import Profiler
+from agents import Observer
+from audio import audio
 
 #self.font = pygame.font.Font(None, 64)
 
 # GAME CLASSES AND METHODS
 
 class MeteorDerby:
-    def __init__(self):
-        pygame.mixer.init(buffer=1024)
-        pygame.init()
+    # how asteroids and bullets are stored; see ArrayDerby
+    entities = 'objects'
+
+    def __init__(self, wrap_mode='mirrors', headless=False, tick_rate=60,
+                 broad_phase='grid', render_mode='full',
+                 asset_cache='assets.cache', seed=None, record=None,
+                 profile=False, trace=None, controller=None, sound=True,
+                 audio_buffer=1024, lod_sprites=400, size=(1024, 768),
+                 sprite_scale=1.0, render_scale=1.0, scale_mode='offscreen',
+                 spawn_budget=64, stream=None):
+        self.headless = headless
+        if headless:
+            # no window and no sound; the dummy display still lets surfaces
+            # be converted for the simulation's masks
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+            pygame.init()
+            audio.close()
+        else:
+            if sound:
+                audio.open(buffer=audio_buffer)
+            pygame.init()
+            if not sound:
+                audio.close()
         pygame.display.set_caption('Asteroids')
-        self.screen = pygame.display.set_mode((1024, 768))
-        self.background = pygame.image.load('background.jpg').convert()
+        self._set_display(size, render_scale, scale_mode)
+        if asset_cache is not None:
+            assets.baked = BakedAssets(asset_cache)
+        self.background = self._tile(assets.image('background.jpg', alpha=False))
+        # sprites are scaled once here, never per frame
+        set_sprite_scale(sprite_scale)
+        GameObject.animate_images = not headless
+        # load everything up front so that starting a game reads no files
+        for cls in (Starship, Asteroid, Bullet):
+            cls.preload()
+        # effects are only for the picture, so headless games have none
+        if not headless:
+            Explosion.preload()
+        # one font for every game, so restarts open no files and rendered
+        # text stays cached across them
+        self.font = pygame.font.Font(None, 64)
         self.clock = pygame.time.Clock()
         self.framerate = 60
+        # the simulation always advances in steps of 1 / tick_rate seconds,
+        # time_scale game seconds per real second; framerate only caps
+        # rendering. Speeds are in pixels per tick, so tick_rate sets how
+        # fast the game plays: 120 runs it at twice the speed of 60
+        self.time_scale = 1.0
+        self.tick_rate = tick_rate
+        self.dt = 1.0 / tick_rate
+        self.grid = SpatialHash(self.screen.get_size(), cell_size=128)
+        self.wrap_mode = wrap_mode
+        MirroredGameObject.wrap_mode = wrap_mode
+        self.torus_collided = TorusCollider(self.screen.get_size())
+        if wrap_mode == 'torus':
+            self.collided = self.torus_collided
+        else:
+            self.collided = collide_rect_mask
+        # 'grid' tests sprite by sprite against a SpatialHash, 'circles'
+        # finds every overlapping pair in one NumPy pass (see circle_pairs)
+        self.broad_phase = broad_phase
+        # kept on the game, like collided, so a profiler can hook it per game
+        self.circle_pairs = circle_pairs
+        # 'full' redraws the background and flips every frame, 'dirty' only
+        # repaints and updates the rects that changed
+        self.render_mode = render_mode
+        # above this many asteroid sprites the cheaper level of detail is
+        # used (see Asteroid.lod); None never uses it
+        self.lod_sprites = lod_sprites
+        # a bullet's rect is at most its diagonal across
+        self._cull_margin = math.ceil(math.hypot(
+            *Bullet._images[None].get_size()))
+        # collisions only record spawns and kills; they are carried out at
+        # the end of the tick, at most spawn_budget spawns per tick
+        self.commands = CommandBuffer(spawn_budget)
+        self._full_redraw = True
+        self._drawn = []
+        # every run starts from a seed so that, together with the recorded
+        # controls, it can be reproduced exactly (see replay.py)
+        self.seed = random.randrange(2 ** 63) if seed is None else seed
+        self.record = record
+        self.recorder = None
+        # with stream, every tick's snapshot is sent to a spectator (see
+        # spectate() and snapshot.open_stream)
+        self.stream = stream
+        self._stream = None
+        self._encoder = snapshot.Encoder()
+        # keyboard state gathered by _process_input for the next step
+        self._turn = 0
+        self._thrust = False
+        self._fire = 0
+        self._restart = False
+        # an agents.Controller, when given, plays instead of the keyboard
+        self.set_controller(controller)
+        # what the last step was played with
+        self.controls = IDLE
+        # profiling is opt-in: without it nothing below is hooked at all
+        self.trace = trace
+        self.profiler = None
+        if profile or trace is not None:
+            self.profiler = Profiler()
+            self.profiler.overlay = bool(profile)
+            self._instrument()
+
+    def _set_display(self, size, render_scale, scale_mode):
+        """
+        Open the window. The game is drawn on self.screen, which is always
+        the logical playfield of the given size; with a render_scale other
+        than 1 the window is that many times larger, and the playfield is
+        either drawn offscreen and scaled into it once a frame ('offscreen')
+        or left to SDL to scale ('scaled', pygame.SCALED).
+        """
+        size = tuple(size)
+        if self.headless or render_scale == 1:
+            self.screen = self.display = pygame.display.set_mode(size)
+        elif scale_mode == 'scaled':
+            # SDL picks the largest integer scale the desktop allows
+            self.screen = self.display = pygame.display.set_mode(
+                size, pygame.SCALED)
+        elif scale_mode == 'offscreen':
+            self.display = pygame.display.set_mode(
+                (round(size[0] * render_scale), round(size[1] * render_scale)))
+            self.screen = pygame.Surface(size).convert()
+        else:
+            raise ValueError('unknown scale mode: %r' % scale_mode)
+
+    def _tile(self, image):
+        # the background repeats over playfields larger than the image
+        if image.get_size() == self.screen.get_size():
+            return image
+        background = pygame.Surface(self.screen.get_size()).convert()
+        w, h = image.get_size()
+        for x in range(0, background.get_width(), w):
+            for y in range(0, background.get_height(), h):
+                background.blit(image, (x, y))
+        return background
+
+    def _instrument(self):
+        profiler = self.profiler
+        for method, name in (('_process_input', 'input'),
+                             ('_apply_controls', 'controls'),
+                             ('_update_objects', 'update'),
+                             ('_collide', 'collision'),
+                             ('_apply_commands', 'commands'),
+                             ('_draw', 'draw')):
+            profiler.hook(self, method, name, phase=True)
+        # display.flip / display.update; nested in draw
+        profiler.hook(self, '_present', 'present')
+        profiler.hook(self.grid, 'build', 'grid_build')
+        profiler.hook(self, 'circle_pairs', 'circle_pairs')
+        profiler.hook(self.grid, 'collisions', 'grid_queries', timed=False)
+        # every narrow-phase test goes through one of these two
+        profiler.hook(self, 'collided', 'mask_tests', timed=False)
+        profiler.hook(self, 'torus_collided', 'mask_tests', timed=False)
+        profiler.gauge('asteroids', lambda: len(self.asteroids))
+        profiler.gauge('bullets', lambda: len(self.bullets))
+        profiler.gauge('rotation_hits', lambda: rotation_cache.hits, delta=True)
+        profiler.gauge('rotation_misses', lambda: rotation_cache.misses,
+                       delta=True)
 
     def _new_game(self):
+        # spawns and kills held back from the last game must not carry over
+        self.commands.clear()
         self.asteroids = Group()
+        self.shots_status = 0
         for _ in range(6):
-            Asteroid(self.screen, groups=[self.asteroids])
+            self._spawn_asteroid()
         self.bullets = Group()
+        self.effects = Group()
         self.starship = Starship(self.screen)
         self.starships = self.starship.mirrors
         self.status_text = ''
-        self.font = pygame.font.Font(None, 64)
-        self.shots_status = 0
         self.game_over = False
         self.paused = False
+        self.ticks = 0
 
-    def mainloop(self):
+    def _spawn_asteroid(self, pos=None, velocity=None, size='big'):
+        asteroid = Asteroid.spawn(self.screen, pos, velocity, size,
+                                  [self.asteroids])
+        self.shots_status += asteroid.shots
+        return asteroid
 
+    def _start(self):
+        seed_rng(self.seed)
         self._new_game()
+        # one recording covers every game of a run; restarts are recorded
+        # as controls
+        if self.record is not None and self.recorder is None:
+            self.recorder = Recorder(self.record, self.seed, self.settings())
+        if self.stream is not None and self._stream is None:
+            self._stream = snapshot.open_stream(self.stream, 'w')
+        # a spectator can only join at a key frame
+        self._encoder.key()
+
+    def mainloop(self):
+
+        self._start()
+        self._begin_run()
         self.run = True
+        accumulator = 0.0
+        previous = time.perf_counter()
         while self.run:
             self._process_input()
-            self._process_game_logic()
-            self._draw()
+            now = time.perf_counter()
+            # clamp so a long stall doesn't turn into a burst of catch-up steps
+            elapsed = min(now - previous, 0.25)
+            previous = now
+            accumulator += elapsed * self.time_scale
+            while accumulator >= self.dt:
+                self.step()
+                accumulator -= self.dt
+            audio.flush()
+            self._draw(accumulator / self.dt)
+            self.clock.tick(self.framerate)
+            if self.profiler is not None:
+                self.profiler.frame()
+        self._end_run()
+        self.close_recording()
+        self.close_stream()
+        audio.close()
         pygame.quit()
 
+    def simulate(self, ticks, new_game=True):
+        """
+        Run the simulation for up to ticks fixed steps as fast as possible,
+        without rendering, played by the controller if there is one (idle
+        otherwise). Stops early when the game is over and returns the number
+        of steps taken.
+        """
+        if new_game:
+            self._start()
+        self._begin_run()
+        controls = IDLE if self.controller is None else None
+        steps = 0
+        while steps < ticks and not self.game_over:
+            self.step(controls)
+            steps += 1
+            if self.profiler is not None:
+                self.profiler.frame()
+        self._end_run()
+        return steps
+
+    def _begin_run(self):
+        # the rotation cache is shared by every game in the process, so this
+        # game's profiler only hooks it while the game runs
+        if self.profiler is not None:
+            self.profiler.hook(rotation_cache, '_rotate', 'rotate')
+
+    def _end_run(self):
+        if self.profiler is not None:
+            self.profiler.unhook(rotation_cache)
+            if self.trace is not None:
+                self.profiler.export(self.trace)
+
+    def settings(self):
+        """
+        Everything besides the seed and the controls that decides how a game
+        plays out. Recordings keep it, and replay() refuses to play one made
+        with different settings.
+        """
+        tunings = {}
+        for name in models.TUNINGS:
+            cls, attr = name.split('.')
+            tunings[name] = getattr(getattr(models, cls), attr)
+        return {
+            'entities': self.entities,
+            'size': self.screen.get_size(),
+            'wrap_mode': self.wrap_mode,
+            'broad_phase': self.broad_phase,
+            'sprite_scale': models.sprite_scale,
+            'spawn_budget': self.commands.spawn_budget,
+            'lod_sprites': self.lod_sprites,
+            'tunings': tunings,
+        }
+
+    def replay(self, path):
+        """
+        Play back a recording made with record=path as fast as possible,
+        drawing every step unless headless. Returns the number of steps.
+        """
+        recording = Replay(path)
+        recording.check(self.settings())
+        self.seed = recording.seed
+        self._start()
+        self._begin_run()
+        self.run = True
+        steps = 0
+        for controls in recording:
+            if not self.headless:
+                for event in pygame.event.get():
+                    if (event.type == pygame.QUIT or event.type == pygame.KEYDOWN
+                            and event.key == pygame.K_ESCAPE):
+                        self.run = False
+                if not self.run:
+                    break
+            self.step(controls)
+            steps += 1
+            audio.flush()
+            if not self.headless:
+                self._draw()
+            if self.profiler is not None:
+                self.profiler.frame()
+        self._end_run()
+        return steps
+
+    def step(self, controls=None):
+        """
+        Advance the simulation by one tick using controls or, when controls
+        is None, those of the controller or the keyboard state gathered by
+        _process_input.
+        """
+        if controls is None:
+            controls = self._take_controls()
+            if self.controller is not None:
+                # the keyboard can still start a new game (TAB)
+                restart = controls.new_game
+                controls = self.controller.act(self.observer.observe(self))
+                if restart:
+                    controls = controls._replace(new_game=True)
+        # paused steps change nothing, so they are left out of recordings
+        if self.recorder is not None and (not self.paused or controls.new_game):
+            self.recorder.record(controls)
+        self.controls = controls
+        self._apply_controls(controls)
+        self._process_game_logic()
+        if self._stream is not None:
+            snapshot.write_frame(self._stream, self._encoder.encode(self.save()))
+            self._stream.flush()
+
+    def set_controller(self, controller):
+        """Let controller (an agents.Controller, or None) play from now on."""
+        self.controller = controller
+        self.observer = None
+        if controller is not None:
+            self.observer = Observer(self.screen.get_size(), controller.k)
+
+    def close_recording(self):
+        if self.recorder is not None:
+            self.recorder.close()
+            self.recorder = None
+
+    def close_stream(self):
+        if self._stream is not None:
+            self._stream.flush()
+            if self._stream is not sys.stdout.buffer:
+                self._stream.close()
+            self._stream = None
+
+    def save(self):
+        """
+        Capture the simulation state at the end of the current tick as a
+        snapshot.Snapshot (see there for the layout); restore() puts a game
+        back in it.
+        """
+        ship = self.starship
+        flags = ((snapshot.ALIVE if ship.alive else 0) |
+                 (snapshot.ANIMATING if ship._animate else 0) |
+                 (0 if ship.groups() else snapshot.KILLED))
+        rows = [(ship.id, snapshot.SHIP, 0, flags,
+                 ship._age if ship._animate else 0,
+                 *ship.pos, *ship.velocity, *ship.direction, 0.0)]
+        self._save_entities(rows)
+        pieces = [(pos[0], pos[1], snapshot.SIZE_CODE[size])
+                  for _, (pos, size) in self.commands.spawns()]
+        # a count can't be read without taking a number from it
+        next_id = next(GameObject._id_counter)
+        GameObject._id_counter = count(next_id)
+        return snapshot.Snapshot.from_rows(
+            rows, self.ticks, self.shots_status,
+            snapshot.STATUS.index(self.status_text), self.paused, next_id,
+            rng.getstate(), pieces, self._free_slots())
+
+    def _save_entities(self, rows):
+        size_code = snapshot.SIZE_CODE
+        # mirror copies are rebuilt from their master
+        rows += [(asteroid.id, snapshot.ASTEROID, size_code[asteroid.size], 0,
+                  0, *asteroid.pos, *asteroid.velocity, *asteroid.direction,
+                  asteroid.angular_velocity)
+                 for asteroid in self.asteroids.spritedict
+                 if isinstance(asteroid, Asteroid)]
+        rows += [(bullet.id, snapshot.BULLET, 0, 0, 0, *bullet.pos,
+                  *bullet.velocity, *bullet.direction, 0.0)
+                 for bullet in self.bullets.spritedict]
+
+    def _free_slots(self):
+        return ()
+
+    def restore(self, state):
+        """
+        Put the game in the state saved by save(), given as a Snapshot or
+        its packed bytes. From there the game plays on exactly as the saved
+        one did, RNG included. Nothing is played or drawn.
+        """
+        if not isinstance(state, snapshot.Snapshot):
+            state = snapshot.Snapshot.unpack(state)
+        if getattr(self, 'asteroids', None) is None:
+            self._new_game()
+        self.commands.clear()
+        self.effects.empty()
+        self._clear_entities()
+        entities = []
+        for record in state:
+            if record[1] == snapshot.SHIP:
+                self._restore_ship(*record)
+            else:
+                entities.append(record)
+        self._restore_entities(entities, state.free)
+        for x, y, size in state.pieces:
+            self.commands.spawn(self._spawn_piece, (x, y),
+                                snapshot.SIZES[size])
+        self.ticks = state.tick
+        self.shots_status = state.shots
+        self.status_text = snapshot.STATUS[state.status]
+        self.game_over = bool(self.status_text)
+        self.paused = bool(state.paused)
+        rng.setstate(snapshot.unpack_rng(state.rng))
+        GameObject._id_counter = count(state.next_id)
+        self._full_redraw = True
+
+    def _restore_ship(self, id, kind, size, flags, frame, x, y, vx, vy, hx, hy,
+                      spin):
+        ship = self.starship = Starship(self.screen, Vector2(x, y),
+                                        Vector2(vx, vy))
+        self.starships = ship.mirrors
+        ship.id = id
+        ship.direction.update(hx, hy)
+        ship.alive = bool(flags & snapshot.ALIVE)
+        if flags & snapshot.ANIMATING:
+            ship.animate('explosion', on_finish=ship.kill)
+            ship._age = frame
+            ship._show_frame()
+        else:
+            ship._sync_image()
+        if flags & snapshot.KILLED:
+            ship.kill()
+
+    def _clear_entities(self):
+        for sprite in self.asteroids.sprites() + self.bullets.sprites():
+            # a master takes its mirror copies with it
+            if isinstance(sprite, GameObject):
+                sprite.kill()
+
+    def _restore_entities(self, records, free):
+        for (id, kind, size, flags, frame, x, y, vx, vy, hx, hy,
+             spin) in records:
+            if kind == snapshot.ASTEROID:
+                obj = Asteroid.spawn(self.screen, (x, y), (vx, vy),
+                                     snapshot.SIZES[size], [self.asteroids])
+                obj.angular_velocity = spin
+            else:
+                obj = Bullet.spawn(self.screen, (x, y), (vx, vy),
+                                   [self.bullets])
+            obj.id = id
+            obj.direction.update(hx, hy)
+            obj._sync_image()
+
+    def spectate(self, source):
+        """
+        Show the snapshots another game streams (see stream) as they arrive,
+        until the stream ends or the window is closed. Returns the number of
+        snapshots shown.
+        """
+        stream = snapshot.open_stream(source, 'r')
+        decoder = snapshot.Decoder()
+        self.run = True
+        frames = 0
+        while self.run:
+            for event in pygame.event.get():
+                if (event.type == pygame.QUIT or event.type == pygame.KEYDOWN
+                        and event.key == pygame.K_ESCAPE):
+                    self.run = False
+            frame = snapshot.read_frame(stream)
+            if frame is None:
+                break
+            self.restore(decoder.decode(frame))
+            frames += 1
+            if not self.headless:
+                self._draw()
+        if stream is not sys.stdin.buffer:
+            stream.close()
+        return frames
+
+    def _take_controls(self):
+        controls = Controls(self._turn, self._thrust,
+                            min(self._fire, MAX_FIRE), self._restart)
+        self._fire = 0
+        self._restart = False
+        return controls
+
+    def _apply_controls(self, controls):
+        if controls.new_game:
+            self._new_game()
+        if self.paused or not self.starship or not self.starship.alive:
+            return
+        if controls.turn > 0:
+            self.starship.rotate_clockwise()
+        elif controls.turn < 0:
+            self.starship.rotate_counterclockwise()
+        if controls.thrust:
+            self.starship.accelerate()
+        for _ in range(controls.fire):
+            self._fire_bullet()
+
+    def _fire_bullet(self):
+        self.starship.fire(self.bullets)
+
     def _process_input(self):
         # EVENTS
         for event in pygame.event.get():
             if (self.game_over and event.type == pygame.KEYDOWN and
                 event.key == pygame.K_TAB):
-                self._new_game()
+                self._restart = True
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
                 self.paused ^= True
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
-                self.framerate = 1
+                self.time_scale = 1 / 60
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
-                self.framerate = 60
+                self.time_scale = 1.0
+            elif (event.type == pygame.KEYDOWN and event.key == pygame.K_F3
+                  and self.profiler is not None):
+                self.profiler.overlay ^= True
+                self._full_redraw = True
             elif event.type == pygame.QUIT:
                 self.run = False
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
@@ -65,116 +561,251 @@ class MeteorDerby:
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                 if not self.starship or not self.starship.alive:
                     continue
-                self.starship.fire(self.bullets)
+                self._fire += 1
 
+        # held keys are sampled here and applied on every simulation step
         pressed = pygame.key.get_pressed()
-        if self.starship and self.starship.alive:
-            if pressed[pygame.K_RIGHT]:
-                self.starship.rotate_clockwise()
-            elif pressed[pygame.K_LEFT]:
-                self.starship.rotate_counterclockwise()
-            if pressed[pygame.K_UP]:
-                self.starship.accelerate()
-            #elif pressed[pygame.K_SPACE]:
-            #    # set up rapid fire here
-            #    if self.starship:
-            #        self.starship.fire(self.bullets)
+        self._turn = (1 if pressed[pygame.K_RIGHT] else
+                      -1 if pressed[pygame.K_LEFT] else 0)
+        self._thrust = bool(pressed[pygame.K_UP])
+        #elif pressed[pygame.K_SPACE]:
+        #    # set up rapid fire here
+        #    if self.starship:
+        #        self.starship.fire(self.bullets)
 
     def _process_game_logic(self):
 
         #for obj in self._get_game_objects():
         #    obj.update()
         if not self.paused:
+            self.ticks += 1
+            self._update_objects()
+            # LOGIC
+            self._collide()
+            self._apply_commands()
 
-            self.asteroids.update()
-            self.bullets.update()
-            if self.starship is not None:
-                self.starship.update()
+    def _update_objects(self):
+        Asteroid.lod = (self.lod_sprites is not None and
+                        len(self.asteroids) > self.lod_sprites)
+        self.asteroids.update()
+        self.bullets.update()
+        if self.starship is not None:
+            self.starship.update()
+        self.effects.update()
 
-            # LOGIC
-            if self.starship and self.starship.alive:
-                for ship in self.starship.mirrors:
-                    possible_hits = pygame.sprite.spritecollide(ship, self.asteroids, False)
-                    verified_hits = pygame.sprite.spritecollide(ship, possible_hits, False, pygame.sprite.collide_mask)
-                    for asteroid in verified_hits:
-                        asteroid.split()
-                        ship.explode()
-                        self.status_text = 'You lost!'
-                        self.game_over = True
-                        break
+    def _collide(self):
+        if self.broad_phase == 'circles':
+            self._collide_circles()
+        else:
+            self._collide_grid()
 
-            for bullet in self.bullets:
-                possible_hits = pygame.sprite.spritecollide(bullet, self.asteroids, False)
-                verified_hits = pygame.sprite.spritecollide(bullet, possible_hits, False, pygame.sprite.collide_mask)
+    def _collide_grid(self):
+        # asteroid copies out of reach of the screen are left out: bullets
+        # live while they touch it, and any other overlap on the torus has a
+        # point on screen where both objects have a visible copy
+        margin = self._cull_margin
+        killed = self.commands.killed
+        self.grid.build([asteroid for asteroid in self.asteroids
+                         if asteroid.visible(margin)])
+
+        if self.starship and self.starship.alive:
+            for ship in self.starship.mirrors:
+                verified_hits = self.grid.collisions(ship, self.collided)
                 for asteroid in verified_hits:
-                    asteroid.split()
-                    bullet.kill()
-                    if not self.asteroids and not self.status_text:
-                        self.game_over = True
-                        self.status_text = 'You won!'
+                    if not killed(asteroid):
+                        self._ship_hit(ship, asteroid)
+                        break
+
+        for bullet in self.bullets:
+            verified_hits = self.grid.collisions(bullet, self.collided)
+            for asteroid in verified_hits:
+                if not killed(asteroid):
+                    self._bullet_hit(bullet, asteroid)
+                    break
+
+    def _collide_circles(self):
+        # mirrors are left out: circle_pairs and torus_collided both work on
+        # the minimum image, so each pair is tested once
+        asteroids, asteroid_pos, asteroid_radius = self._asteroid_bodies()
+        size = self.screen.get_size()
+        collided = self.torus_collided
+        killed = self.commands.killed
+
+        ship = self.starship
+        if ship and ship.alive:
+            _, hits = self.circle_pairs((ship.pos,), (ship.radius,),
+                                        asteroid_pos, asteroid_radius, size)
+            for a in hits:
+                if collided(ship, asteroids[a]):
+                    self._ship_hit(ship, asteroids[a])
                     break
 
-    def _draw(self):
+        bullets, bullet_pos, bullet_radius = self._bullet_bodies()
+        for b, a in zip(*self.circle_pairs(bullet_pos, bullet_radius,
+                                           asteroid_pos, asteroid_radius,
+                                           size)):
+            bullet, asteroid = bullets[b], asteroids[a]
+            if (not killed(bullet) and not killed(asteroid) and
+                    collided(bullet, asteroid)):
+                self._bullet_hit(bullet, asteroid)
+
+    def _asteroid_bodies(self):
+        asteroids = [asteroid for asteroid in self.asteroids
+                     if isinstance(asteroid, GameObject)]
+        return (asteroids, [asteroid.pos for asteroid in asteroids],
+                [asteroid.radius for asteroid in asteroids])
+
+    def _asteroid_motion(self):
+        # positions, velocities and radii without the sprites, for Observer
+        asteroids = [asteroid for asteroid in self.asteroids
+                     if isinstance(asteroid, GameObject)]
+        return ([asteroid.pos for asteroid in asteroids],
+                [asteroid.velocity for asteroid in asteroids],
+                [asteroid.radius for asteroid in asteroids])
+
+    def _bullet_bodies(self):
+        bullets = self.bullets.sprites()
+        return (bullets, [bullet.pos for bullet in bullets],
+                [bullet.radius for bullet in bullets])
+
+    def _ship_hit(self, ship, asteroid):
+        self._split(asteroid)
+        ship.explode()
+        self.status_text = 'You lost!'
+        self.game_over = True
+
+    def _bullet_hit(self, bullet, asteroid):
+        self._split(asteroid)
+        self.commands.kill(bullet)
+
+    def _apply_commands(self):
+        self.commands.apply()
+        if (not self.asteroids and not self.commands.spawns_pending and
+                not self.status_text):
+            self.game_over = True
+            self.status_text = 'You won!'
+
+    def _interpolate(self, alpha):
+        # draw each object between its previous and current simulation state;
+        # pos - velocity is the previous position even across a wrap
+        lag = 1.0 - alpha
+        for group in (self.asteroids, self.bullets, self.starships):
+            for sprite in group:
+                if isinstance(sprite, GameObject):
+                    sprite.rect.center = sprite.pos - sprite.velocity * lag
+
+    def _shots_left(self):
+        # full recount; during play shots_status is kept up to date by _split
+        return sum(asteroid.shots for asteroid in self.asteroids
+                   if isinstance(asteroid, Asteroid))
+
+    def _split(self, asteroid):
+        # the pieces' shots are counted now, even if the spawn budget delays
+        # some of them to a later tick
+        size = Asteroid.PIECES.get(asteroid.size)
+        if not self.headless:
+            # explosions on screen at once take turns between orientations
+            Explosion.spawn(asteroid.size, tuple(asteroid.pos),
+                            len(self.effects), [self.effects])
+        self.commands.kill(asteroid)
+        self.shots_status -= asteroid.shots
+        if size is not None:
+            pos = tuple(asteroid.pos)
+            for _ in range(Asteroid.pieces):
+                self.commands.spawn(self._spawn_piece, pos, size)
+            self.shots_status += Asteroid.pieces * Asteroid.shots_for(size)
+
+    def _spawn_piece(self, pos, size):
+        asteroid = self._spawn_asteroid(pos, None, size)
+        self.shots_status -= asteroid.shots
+
+    def _draw(self, alpha=1.0):
         # DRAWING
 
-        self.screen.blit(self.background, (0, 0))
+        # in 'dirty' mode only what was drawn last frame is erased and only
+        # the erased and newly drawn rects are pushed to the display
+        dirty = self.render_mode == 'dirty' and not self._full_redraw
+        if dirty:
+            for rect in self._drawn:
+                self.screen.blit(self.background, rect, rect)
+        else:
+            self.screen.blit(self.background, (0, 0))
 
-        self.asteroids.draw(self.screen)
-        self.bullets.draw(self.screen)
-        self.starships.draw(self.screen)
+        interpolate = alpha < 1.0 and not self.paused
+        if interpolate:
+            self._interpolate(alpha)
+
+        if self.wrap_mode == 'torus':
+            drawn = draw_wrapped(self.screen, self.asteroids)
+            drawn += draw_group(self.screen, self.effects)
+            drawn += draw_group(self.screen, self.bullets)
+            drawn += draw_wrapped(self.screen, self.starships)
+        else:
+            # mirror copies that are entirely off screen are culled
+            drawn = draw_visible(self.screen, self.asteroids)
+            drawn += draw_group(self.screen, self.effects)
+            drawn += draw_group(self.screen, self.bullets)
+            drawn += draw_visible(self.screen, self.starships)
 
         if self.status_text:
-            print_text(self.screen, self.status_text, self.font)
+            drawn.append(print_text(self.screen, self.status_text, self.font))
 
-        if self.starship is not None:
-            shots_left = 0
+        drawn.append(print_text(self.screen, str(self.shots_status), self.font, (0, 0)))
 
-            # broken for now
-            for asteroid in self.asteroids:
-                if isinstance(asteroid, Asteroid):
-                    if asteroid.size == 'big':
-                        shots_left += 13
-                    elif asteroid.size == 'medium':
-                        shots_left += 4
-                    else:
-                        shots_left += 1
+        if self.profiler is not None and self.profiler.overlay:
+            drawn.append(self.profiler.draw(self.screen))
 
-            self.shots_status = shots_left
+        if interpolate:
+            self._interpolate(1.0)
 
-        print_text(self.screen, str(self.shots_status), self.font, (0, 0))
+        self._present(drawn, dirty)
 
+    def _present(self, drawn, dirty):
         if not self.paused:
-            pygame.display.flip()
-        self.clock.tick(self.framerate)
+            if self.display is not self.screen:
+                # the whole playfield is scaled into the window once a frame
+                pygame.transform.scale(self.screen, self.display.get_size(),
+                                       self.display)
+                pygame.display.flip()
+            elif dirty:
+                pygame.display.update(self._drawn + drawn)
+            else:
+                pygame.display.flip()
+            self._full_redraw = False
+        else:
+            self._full_redraw = True
+        self._drawn = drawn
 
 
 class GameTest(MeteorDerby):
 
     def _new_game(self):
+        self.commands.clear()
         self.asteroids = OrderedUpdates()
         for _ in range(1):
-            self.main_asteroid = Asteroid(self.screen, groups=[self.asteroids])
+            self.main_asteroid = Asteroid.spawn(self.screen, groups=[self.asteroids])
         self.bullets = Group()
+        self.effects = Group()
         self.starship = Starship(self.screen)
         self.starships = self.starship.mirrors
         self.status_text = ''
-        self.font = pygame.font.Font(None, 64)
-        self.shots_status = 0
+        self.shots_status = self._shots_left()
         self.game_over = False
         self.paused = False
+        self.ticks = 0
 
     def _process_input(self):
         # EVENTS
         for event in pygame.event.get():
             if (self.game_over and event.type == pygame.KEYDOWN and
                 event.key == pygame.K_TAB):
-                self._new_game()
+                self._restart = True
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_p:
                 self.paused ^= True
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_s:
-                self.framerate = 1
+                self.time_scale = 1 / 60
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_f:
-                self.framerate = 60
+                self.time_scale = 1.0
             elif event.type == pygame.QUIT:
                 self.run = False
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
@@ -182,14 +813,91 @@ class GameTest(MeteorDerby):
             elif event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
                 if not self.starship:
                     continue
-                self.starship.fire(self.bullets)
+                self._fire += 1
 
         pressed = pygame.key.get_pressed()
-        if self.starship:
-            if pressed[pygame.K_RIGHT]:
-                self.starship.rotate_clockwise()
-            elif pressed[pygame.K_LEFT]:
-                self.starship.rotate_counterclockwise()
-            if pressed[pygame.K_UP]:
-                self.starship.accelerate()
+        self._turn = (1 if pressed[pygame.K_RIGHT] else
+                      -1 if pressed[pygame.K_LEFT] else 0)
+        self._thrust = bool(pressed[pygame.K_UP])
+
+
+
+class ArrayDerby(MeteorDerby):
+    """
+    MeteorDerby with asteroids and bullets stored in a NumPy EntityWorld.
+
+    The groups hold EntityView sprites used for drawing and collision tests
+    only; movement, wrapping and bullet culling happen in EntityWorld.step().
+    Wrapping is always done in 'torus' mode.
+    """
+    entities = 'arrays'
+
+    def __init__(self, broad_phase='circles', **kwargs):
+        super().__init__(wrap_mode='torus', broad_phase=broad_phase, **kwargs)
+
+    def _new_game(self):
+        self.world = EntityWorld(self.screen)
+        super()._new_game()
+
+    def _spawn_asteroid(self, pos=None, velocity=None, size='big'):
+        pos = get_random_pos(self.screen) if pos is None else pos
+        index = self.world.spawn_asteroid(pos, velocity, size, [self.asteroids])
+        asteroid = self.world.views[index]
+        self.shots_status += asteroid.shots
+        return asteroid
+
+    def _fire_bullet(self):
+        ship = self.starship
+        self.world.spawn_bullet(ship.pos,
+                                ship.velocity + ship.direction * ship.bullet_speed,
+                                [self.bullets])
+        ship.laser.play()
+
+    def _update_objects(self):
+        self.world.step()
+        super()._update_objects()
+
+    def _interpolate(self, alpha):
+        super()._interpolate(alpha)
+        self.world.lag = 1.0 - alpha
+
+    def _save_entities(self, rows):
+        first = snapshot.SLOT_ID
+        rows += [(first + slot, snapshot.ASTEROID, size + 1, 0, 0,
+                  x, y, vx, vy, angle, 0.0, spin) if kind == ASTEROID else
+                 (first + slot, snapshot.BULLET, 0, 0, 0,
+                  x, y, vx, vy, angle, 0.0, 0.0)
+                 for slot, kind, size, x, y, vx, vy, angle, spin
+                 in self.world.entities()]
+
+    def _free_slots(self):
+        return self.world.free
+
+    def _clear_entities(self):
+        self.asteroids.empty()
+        self.bullets.empty()
+        self.world = EntityWorld(self.screen)
+
+    def _restore_entities(self, records, free):
+        world = self.world
+        for (id, kind, size, flags, frame, x, y, vx, vy, angle, _,
+             spin) in records:
+            if kind == snapshot.ASTEROID:
+                world.place(id - snapshot.SLOT_ID, ASTEROID, (x, y), (vx, vy),
+                            angle, spin, size - 1, [self.asteroids])
+            else:
+                world.place(id - snapshot.SLOT_ID, BULLET, (x, y), (vx, vy),
+                            angle, 0.0, 0, [self.bullets])
+        world.free = free
+
+    def _asteroid_bodies(self):
+        return self.world.bodies(ASTEROID)
+
+    def _asteroid_motion(self):
+        return self.world.motion(ASTEROID)
+
+    def _bullet_bodies(self):
+        return self.world.bodies(BULLET)
 
+    def _shots_left(self):
+        return self.world.shots_left()
@@ -1,8 +1,146 @@
 #!/usr/bin/env python
 
-from game import MeteorDerby
+import argparse
+import importlib
+import os
+import sys
+# snapshots may be streamed to stdout, so pygame must not print to it
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+from game import MeteorDerby, ArrayDerby
+from models import Explosion
+from assetcache import BakedAssets
+from utils import assets
+
+
+def _size(text):
+    try:
+        w, h = (int(n) for n in text.lower().split('x'))
+    except ValueError:
+        raise argparse.ArgumentTypeError('expected WxH, e.g. 1920x1080')
+    return w, h
+
 
 if __name__ == "__main__":
-    meteorderby = MeteorDerby()
-    meteorderby.mainloop()
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--wrap', choices=('mirrors', 'torus'), default='mirrors',
+                        help='how objects wrap around the screen edges')
+    parser.add_argument('--entities', choices=('objects', 'arrays'),
+                        default='objects',
+                        help="'arrays' keeps asteroids and bullets in NumPy "
+                             "arrays (implies --wrap torus)")
+    parser.add_argument('--broad-phase', choices=('grid', 'circles'),
+                        help='collision broad phase (default: grid, or '
+                             'circles with --entities arrays)')
+    parser.add_argument('--render', choices=('full', 'dirty'), default='full',
+                        help="'dirty' only repaints the areas that changed")
+    parser.add_argument('--asset-cache', default='assets.cache', metavar='PATH',
+                        help='prebaked asset cache to load from (default: '
+                             '%(default)s)')
+    parser.add_argument('--bake-assets', action='store_true',
+                        help='write the prebaked asset cache and exit')
+    parser.add_argument('--headless', type=int, nargs='?', const=3600,
+                        metavar='TICKS',
+                        help='run without display or audio; on its own, '
+                             'simulates TICKS steps (default: %(const)s)')
+    parser.add_argument('--seed', type=int,
+                        help='seed for the game RNG (default: random)')
+    parser.add_argument('--record', metavar='PATH',
+                        help='record the seed and every step\'s input to PATH')
+    parser.add_argument('--replay', metavar='PATH',
+                        help='play back a recording as fast as possible')
+    parser.add_argument('--profile', action='store_true',
+                        help='show the profiler overlay (F3 toggles it)')
+    parser.add_argument('--trace', metavar='PATH',
+                        help='profile and write a Chrome trace to PATH on exit')
+    parser.add_argument('--no-sound', action='store_true',
+                        help='play without audio')
+    parser.add_argument('--audio-buffer', type=int, default=1024,
+                        metavar='SAMPLES',
+                        help='mixer buffer size; smaller is lower latency '
+                             '(default: %(default)s)')
+    parser.add_argument('--controller', metavar='MODULE:CLASS',
+                        help='let an agents.Controller play, e.g. '
+                             'agents:TurretController')
+    parser.add_argument('--size', type=_size, default=(1024, 768),
+                        metavar='WxH',
+                        help='logical playfield size (default: 1024x768)')
+    parser.add_argument('--sprite-scale', type=float, default=1.0,
+                        metavar='FACTOR',
+                        help='scale every sprite by FACTOR once at startup')
+    parser.add_argument('--render-scale', type=float, default=1.0,
+                        metavar='FACTOR',
+                        help='window size as a multiple of the playfield')
+    parser.add_argument('--scale-mode', choices=('offscreen', 'scaled'),
+                        default='offscreen',
+                        help="'offscreen' scales the finished frame into the "
+                             "window; 'scaled' leaves it to SDL "
+                             "(pygame.SCALED)")
+    parser.add_argument('--spawn-budget', type=int, default=64, metavar='N',
+                        help='most asteroid pieces spawned per tick; larger '
+                             'cascades carry over to the next ticks '
+                             '(default: %(default)s)')
+    parser.add_argument('--stream', metavar='TARGET',
+                        help="send every tick's snapshot to TARGET: '-' "
+                             "(stdout), HOST:PORT or a file")
+    parser.add_argument('--spectate', metavar='SOURCE',
+                        help="show the snapshots streamed from SOURCE: '-' "
+                             "(stdin), [HOST]:PORT to listen on, or a file; "
+                             "use the same --entities as the game streaming")
+    args = parser.parse_args()
+    # keep stdout clean for the stream
+    out = sys.stderr if args.stream == '-' else sys.stdout
+
+    controller = None
+    if args.controller is not None:
+        module, _, name = args.controller.partition(':')
+        controller = getattr(importlib.import_module(module), name)()
+
+    if args.bake_assets:
+        # decode everything from the source files, then write it out
+        MeteorDerby(headless=True, asset_cache=None)
+        # headless games leave out the effects, but windowed ones load them
+        Explosion.preload()
+        count = BakedAssets.bake(assets, args.asset_cache)
+        print(f'baked {count} assets into {args.asset_cache}')
+        raise SystemExit
 
+    headless = args.headless is not None
+    display = dict(size=args.size, sprite_scale=args.sprite_scale,
+                   render_scale=args.render_scale, scale_mode=args.scale_mode,
+                   spawn_budget=args.spawn_budget, stream=args.stream)
+    if args.entities == 'arrays':
+        meteorderby = ArrayDerby(headless=headless, render_mode=args.render,
+                                 broad_phase=args.broad_phase or 'circles',
+                                 asset_cache=args.asset_cache, seed=args.seed,
+                                 record=args.record, profile=args.profile,
+                                 trace=args.trace, controller=controller,
+                                 sound=not args.no_sound,
+                                 audio_buffer=args.audio_buffer, **display)
+    else:
+        meteorderby = MeteorDerby(wrap_mode=args.wrap, headless=headless,
+                                  render_mode=args.render,
+                                  broad_phase=args.broad_phase or 'grid',
+                                  asset_cache=args.asset_cache, seed=args.seed,
+                                  record=args.record, profile=args.profile,
+                                  trace=args.trace, controller=controller,
+                                  sound=not args.no_sound,
+                                  audio_buffer=args.audio_buffer, **display)
+    if args.spectate is not None:
+        frames = meteorderby.spectate(args.spectate)
+        print(f'showed {frames} snapshots', file=out)
+    elif args.replay is not None:
+        try:
+            ticks = meteorderby.replay(args.replay)
+        except ValueError as error:
+            parser.exit(1, f'{error}\n')
+        meteorderby.close_recording()
+        meteorderby.close_stream()
+        print(f'replayed {ticks} ticks: {meteorderby.status_text or "unfinished"}',
+              file=out)
+    elif args.headless is not None:
+        ticks = meteorderby.simulate(args.headless)
+        meteorderby.close_recording()
+        meteorderby.close_stream()
+        print(f'simulated {ticks} ticks', file=out)
+    else:
+        meteorderby.mainloop()
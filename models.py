@@ -1,39 +1,118 @@
 import pygame
 from pygame import Surface, Rect
 import pygame.image
+import math
 import random
 #import operator
 from itertools import count
-from utils import (get_random_pos, get_random_vel, load_sprite_sheet,
-                   load_and_scale, get_random_spin)
+from utils import (get_random_pos, get_random_vel, get_random_spin, assets,
+                   RotationCache, Animation)
+from audio import audio
 from pygame.math import Vector2
-from pygame.transform import rotozoom, rotate
 from pygame.sprite import Sprite, Group
 
 
 UP = Vector2(0, -1)
 
+# shared by every GameObject; rotated frames are keyed by _rotation_key()
+rotation_cache = RotationCache(step=3, maxsize=4096)
+# sprite sizes below are in pixels at scale 1; see set_sprite_scale()
+sprite_scale = 1.0
+# class attributes that change how a game plays out (batch.py --set tunes
+# them); recordings keep their values, see MeteorDerby.settings()
+TUNINGS = ('Starship.acceleration', 'Starship.bullet_speed',
+           'Asteroid.max_speed', 'Asteroid.max_spin', 'Asteroid.pieces',
+           'Asteroid.lod_step')
+
+
+def scaled(size):
+    return (max(1, round(size[0] * sprite_scale)),
+            max(1, round(size[1] * sprite_scale)))
+
+
+def set_sprite_scale(scale):
+    """
+    Draw sprites at scale times their normal size. Images are scaled once,
+    when each class next loads them, and the rotation cache starts over.
+    """
+    global sprite_scale
+    if scale == sprite_scale:
+        return
+    sprite_scale = scale
+    for cls in (Starship, Asteroid, Bullet, Explosion):
+        cls._images_loaded = False
+    rotation_cache.clear()
+
 class GameObject(Sprite):
+    # pygame's Sprite has no __slots__, so instances keep a __dict__ for
+    # Sprite's own bookkeeping; the slots buy faster attribute access more
+    # than memory (see benchmark.py objects)
+    __slots__ = ('id', 'screen', 'image', 'orig_image', 'pos', 'rect', 'radius',
+                 'velocity', 'direction', 'mask', '_animate', '_animation',
+                 '_age', '_on_finish', '_angle_bucket', '_pooled')
     _id_counter = count()
     _images_loaded = False
     _images = None
+    _animations = {}
+    # headless games never draw, so they turn this off: animations then only
+    # keep time, and their frames are never built
+    animate_images = True
+    # subclasses that set this to a list get recycled through spawn()
+    _pool = None
+    _pool_size = 1024
 
     def __init__(self, screen, image=None, pos=None, velocity=None, groups=()):
-        super().__init__(*groups)
-        self.id = next(self._id_counter)
+        super().__init__()
         self._load_images()
+        self.pos = Vector2()
+        self.velocity = Vector2()
+        self.direction = Vector2(UP)
+        self.rect = Rect(0, 0, 0, 0)
+        self._reset(screen, image, pos, velocity, groups)
+
+    def _reset(self, screen, image, pos, velocity, groups):
+        # (re)initialize in place; shared by __init__ and pooled reuse
+        self.id = next(self._id_counter)
         self.screen = screen
         self.image = self._images[None] if image is None else image
         self.orig_image = self.image
-        self.pos = Vector2() if pos is None else pos
-        self.rect = self.image.get_rect()
-        self.rect.center = tuple(self.pos)
-        self.velocity = Vector2() if velocity is None else velocity
-        self.direction = Vector2(UP)
-        self._previous_direction = Vector2()
-        self.mask = pygame.mask.from_surface(self.image)
+        self.pos.update(0, 0) if pos is None else self.pos.update(pos)
+        self.rect.size = self.image.get_size()
+        self.rect.center = self.pos
+        # bounding circle of the image at any rotation
+        self.radius = math.hypot(*self.image.get_size()) / 2
+        self.velocity.update(0, 0) if velocity is None else self.velocity.update(velocity)
+        self.direction.update(UP)
         self._animate = False
-        self._repeat = False
+        self._animation = None
+        self._age = 0
+        self._on_finish = None
+        # masks come from the shared rotation cache and are only swapped
+        # when the angle bucket (or animation frame) changes
+        self._angle_bucket = 0
+        self.mask = rotation_cache.get(self._rotation_key(), 0, self.image).mask
+        self._pooled = False
+        self.add(*groups)
+
+    @classmethod
+    def spawn(cls, *args, **kwargs):
+        """
+        Return a killed instance from the class pool, reset with args, or a
+        new instance when the pool is empty (or the class isn't pooled).
+        """
+        pool = cls.__dict__.get('_pool')
+        if pool:
+            obj = pool.pop()
+            obj.reset(*args, **kwargs)
+            return obj
+        return cls(*args, **kwargs)
+
+    def kill(self):
+        super().kill()
+        pool = type(self).__dict__.get('_pool')
+        if pool is not None and not self._pooled and len(pool) < self._pool_size:
+            self._pooled = True
+            pool.append(self)
 
     @classmethod
     def _load_images(cls):
@@ -43,56 +122,76 @@ class GameObject(Sprite):
             cls._images = {None, None}
             cls._images_loaded = True
 
-
-    def animate(self, name, frame_duration=1, repeat=False, on_finish=None):
-        self.frames = self._animations[name]
-        self._repeat_animation = repeat
-        self.current_frame = 0
-        self.last_frame_time = pygame.time.get_ticks()
+    @classmethod
+    def preload(cls):
+        """Load everything instances of this class need up front."""
+        cls._load_images()
+        if cls.animate_images:
+            for animation in cls._animations.values():
+                animation.prepare()
+
+
+    def animate(self, name, on_finish=None):
+        """
+        Play the shared utils.Animation name, one tick per update, instead
+        of the rotated image; on_finish is called after its last frame.
+        """
+        self._animation = self._animations[name]
+        self._age = 0
         self._animate = True
-        self._frame_duration = frame_duration
         self._on_finish = on_finish
+        self._show_frame()
 
-    def update(self):
+    def _show_frame(self):
+        if not self.animate_images:
+            return
+        self.image = self._animation.frame(self._age)
+        self.rect.size = self.image.get_size()
+
+    def _rotation_key(self):
+        return (type(self), getattr(self, 'size', None))
+
+    def _bucket(self):
+        return rotation_cache.bucket(self.direction.angle_to(UP))
 
-        if self._animate is True:
-
-            current_time = pygame.time.get_ticks()
-            if current_time - self.last_frame_time > self._frame_duration:
-                self.current_frame += 1
-                if self.current_frame >= len(self.frames) - 1:
-                    if self._repeat:
-                        self.current_frame = 0
-                    else:
-                        self._animate = False
-                        if self._on_finish is not None:
-                            self._on_finish()
-
-                self.orig_image = self.frames[self.current_frame]
-                self._previous_direction = Vector2() # trigger re-rotation
-                self.last_frame_time = current_time
-
-        if self._previous_direction != self.direction:
-            angle = self.direction.angle_to(UP)
-            prev_center = self.rect.center
-            #self.orig_image
-            #self.image = rotozoom(self.orig_image, angle, 1.0)
-            self.image = rotate(self.orig_image, angle)
-            self.image.get_rect().center = prev_center
-            self._previous_direction.update(self.direction)
-            self.rect = self.image.get_rect()
-            self.rect.center = self.pos
+    def visible(self, margin=0):
+        # wrapped objects always have their center on screen
+        return True
 
+    def update(self):
+        if self._animate:
+            self._age += 1
+            if self._age < len(self._animation):
+                self._show_frame()
+            else:
+                self._animate = False
+                if self._on_finish is not None:
+                    self._on_finish()
+        else:
+            self._sync_image()
         self.pos += self.velocity
         self.rect.center = self.pos
 
+    def _sync_image(self):
+        bucket = self._bucket()
+        if bucket != self._angle_bucket:
+            rotation = rotation_cache.get(self._rotation_key(), bucket,
+                                          self.orig_image)
+            self.image = rotation.image
+            self.mask = rotation.mask
+            self.rect.size = rotation.size
+            self._angle_bucket = bucket
+
 
 class MirrorSprite(Sprite):
+    # MirrorSprite forwards explicitly to its master; anything not listed
+    # here is not available on a mirror
+    __slots__ = ('master', 'screen', 'bearing', '_pos', '_mirror_rect')
 
     def __init__(self, master, bearing, groups=()):
         self.master = master
         self.screen = master.screen
-        self.bearing = Vector2(bearing)
+        self.bearing = tuple(bearing)
         self._pos = Vector2()
         self._mirror_rect = Rect(master.rect)
         self._mirror_rect.center = master.pos
@@ -104,8 +203,9 @@ class MirrorSprite(Sprite):
 
     @property
     def rect(self):
-        self._mirror_rect.size = self.master.rect.size
-        self._mirror_rect.center = self._apply_offsets(self.master.rect.center)
+        master_rect = self.master.rect
+        self._mirror_rect.size = master_rect.size
+        self._mirror_rect.center = self._apply_offsets(master_rect.center)
         return self._mirror_rect
 
     @property
@@ -116,70 +216,120 @@ class MirrorSprite(Sprite):
     def mask(self):
         return self.master.mask
 
+    def visible(self, margin=0):
+        # a copy can only reach the screen (grown by margin on every side)
+        # while its master crosses the edges it mirrors; checked on the
+        # master's rect, so culled copies never compute their own
+        rect = self.master.rect
+        w, h = self.screen.get_size()
+        bx, by = self.bearing
+        return ((not bx or rect.left < margin or rect.right > w - margin) and
+                (not by or rect.top < margin or rect.bottom > h - margin))
+
     @property
     def pos(self):
         self._pos.update(self._apply_offsets(self.master.pos))
         return self._pos
 
     def _apply_offsets(self, p):
+        x, y = p
         w, h = self.screen.get_size()
-        p = Vector2(p)
-        xcoef = 1 if abs(p.x) < abs(w - p.x) else -1
-        ycoef = 1 if abs(p.y) < abs(h - p.y) else -1
-        offset = Vector2(w * xcoef * self.bearing[0], h * ycoef * self.bearing[1])
-        return tuple(p + offset)
+        bx, by = self.bearing
+        xcoef = 1 if abs(x) < abs(w - x) else -1
+        ycoef = 1 if abs(y) < abs(h - y) else -1
+        return (x + w * xcoef * bx, y + h * ycoef * by)
 
     @property
-    def image(self):
-        return self.master.image
+    def id(self):
+        return self.master.id
+
+    @property
+    def velocity(self):
+        return self.master.velocity
+
+    @property
+    def direction(self):
+        return self.master.direction
+
+    @property
+    def radius(self):
+        return self.master.radius
+
+    @property
+    def size(self):
+        return self.master.size
+
+    @property
+    def shots(self):
+        return self.master.shots
+
+    def explode(self):
+        self.master.explode()
 
     def kill(self):
         super().kill()  # maybe if we call this first, no infinite loop
         self.master.kill()
-        
-    def __getattr__(self, attr):
-        return getattr(self.master, attr)
 
 class MirroredGameObject(GameObject):
+    __slots__ = ('mirrors', '_mirror_sprites', '_destroyed')
+    # 'mirrors' adds three MirrorSprite copies to every group the object is
+    # in; 'torus' adds none and leaves wrap-around to the collision test
+    # (collision.TorusCollider) and the renderer (utils.draw_wrapped)
+    wrap_mode = 'mirrors'
 
     def __init__(self, screen, image=None, pos=None, velocity=None, clone=False,
                  groups=()):
         self.mirrors = Group()
+        self._mirror_sprites = []
         super().__init__(screen, image, pos, velocity, groups)
-        groups = (self.mirrors, *groups)
-        # create clones & add them to group
 
-        for bearing in ((0, 1), (1, 0), (1, 1)):
-            MirrorSprite(self, bearing, (self.mirrors, *groups))
+    def _reset(self, screen, image, pos, velocity, groups):
+        super()._reset(screen, image, pos, velocity, groups)
+        self._destroyed = False
+        groups = (self.mirrors, *groups)
+        # create clones & add them to group; pooled objects keep theirs
+
+        if self.wrap_mode != 'mirrors':
+            self._mirror_sprites = []
+        elif not self._mirror_sprites:
+            self._mirror_sprites = [MirrorSprite(self, bearing, groups)
+                                    for bearing in ((0, 1), (1, 0), (1, 1))]
+        else:
+            for mirror in self._mirror_sprites:
+                mirror.screen = screen
+                mirror.add(*groups)
 
     def _wrap_position(self):
         x, y = self.pos
         w, h = self.screen.get_size()
-        self.pos = Vector2(x % w, y % h)
+        self.pos.update(x % w, y % h)
 
     def update(self):
         super().update()
         self._wrap_position()
 
     def kill(self):
-        if not hasattr(self, '_destroyed'):
+        if not self._destroyed:
             self._destroyed = True
-            for mirror in self.mirrors:
-                if mirror is not self:
-                    mirror.kill()
+            # Sprite.kill directly: MirrorSprite.kill would only come back
+            # here for its master
+            for mirror in self._mirror_sprites:
+                Sprite.kill(mirror)
         super().kill()
 
 
 class Starship(MirroredGameObject):
+    __slots__ = ('laser', 'boom_sound', 'alive', 'angle')
     _animations = {}
+    acceleration = 0.2
+    bullet_speed = 8.0
 
     def __init__(self, screen, pos=None, velocity=None):
         self._load_images()
         pos = Vector2(screen.get_size()) / 2.0 if pos is None else pos
         super().__init__(screen, None, pos, velocity)
-        self.acceleration = 0.2
-        self.laser = pygame.mixer.Sound('lasercannon.flac')
-        self.boom_sound = pygame.mixer.Sound("explosion.flac")
+        self.laser = audio.cue('lasercannon.flac')
+        self.boom_sound = audio.cue("explosion.flac")
         self.mirrors.add(self)
         self.alive = True
 
@@ -188,12 +338,19 @@ class Starship(MirroredGameObject):
         if not cls._images_loaded:
             if not pygame.get_init():
                 pygame.init()
-            cls._images = {None: load_and_scale('starship.png', (50, 50)).convert_alpha()}
+            cls._images = {None: assets.image('starship.png', scaled((50, 50)))}
+            rotation_cache.preload((cls, None), cls._images[None])
+            cls._animations['explosion'] = Animation(
+                explosion_frames((256, 256)))
             cls._images_loaded = True
 
-        explosion = load_sprite_sheet('explosion.png', (8, 8))
-        explosion.append(pygame.Surface((0, 0), pygame.SRCALPHA))
-        cls._animations['explosion'] = explosion
+    @classmethod
+    def preload(cls):
+        super().preload()
+        assets.preload(sounds=('lasercannon.flac', 'explosion.flac'))
+        # rapid fire cuts off its oldest shot instead of taking every channel
+        audio.configure('lasercannon.flac', voices=4, reserve=True)
+        audio.configure('explosion.flac', voices=2)
 
 
 
@@ -208,9 +365,8 @@ class Starship(MirroredGameObject):
         self.velocity += self.direction * self.acceleration
 
     def fire(self, bullet_group):
-        bullet_velocity = self.velocity + (self.direction * 8.0)
-        bullet_pos = Vector2(self.pos)
-        Bullet(self.screen, bullet_pos, bullet_velocity, [bullet_group])
+        bullet_velocity = self.velocity + (self.direction * self.bullet_speed)
+        Bullet.spawn(self.screen, self.pos, bullet_velocity, [bullet_group])
         self.laser.play()
 
     def rotate_clockwise(self):
@@ -232,16 +388,36 @@ class Starship(MirroredGameObject):
         self.boom_sound.play()
 
 class Asteroid(MirroredGameObject):
+    __slots__ = ('size', 'angular_velocity')
+    # size of the pieces an asteroid splits into (None: it just breaks up)
+    PIECES = {'big': 'medium', 'medium': 'small', 'small': None}
+    # per-axis speed and spin (degrees per tick) limits, pieces per split
+    max_speed = 2.0
+    max_spin = 5
+    pieces = 3
+    # level of detail, switched on by the game when there are many sprites:
+    # small and fast-spinning asteroids then only turn to every lod_step-th
+    # angle bucket, so they swap frames (and masks) less often
+    lod = False
+    lod_step = 4
+    _pool = []
 
     def __init__(self, screen, pos=None, velocity=None, size='big', groups=()):
         self._load_images()
         image = self._images.get(size, self._images['big'])
         pos = get_random_pos(screen) if pos is None else pos
-        velocity = get_random_vel() if velocity is None else velocity
+        velocity = get_random_vel(self.max_speed) if velocity is None else velocity
         self.size = size
         super().__init__(screen, image, pos, velocity, False, groups)
-        self.counter = count()
-        self.angular_velocity = get_random_spin(5)
+        self.angular_velocity = get_random_spin(self.max_spin)
+
+    def reset(self, screen, pos=None, velocity=None, size='big', groups=()):
+        image = self._images.get(size, self._images['big'])
+        pos = get_random_pos(screen) if pos is None else pos
+        velocity = get_random_vel(self.max_speed) if velocity is None else velocity
+        self.size = size
+        self._reset(screen, image, pos, velocity, groups)
+        self.angular_velocity = get_random_spin(self.max_spin)
 
     @classmethod
     def _load_images(cls):
@@ -251,34 +427,52 @@ class Asteroid(MirroredGameObject):
                 pygame.init()
 
             # Load images
-            cls._images = {size: load_and_scale(path, dims).convert_alpha() for size, path, dims in 
+            cls._images = {size: assets.image(path, scaled(dims)) for size, path, dims in
                             (('small', 'asteroid.png', (40, 40)),
                             ('medium', 'asteroid.png',(95, 95)),
                             ('big', 'asteroid.png', (120, 120)))}
             cls._images[''] = cls._images['big']
             cls._images[None] = cls._images['big']
+            for size in ('small', 'medium', 'big'):
+                rotation_cache.preload((cls, size), cls._images[size])
             cls._images_loaded = True
 
 
-    def split(self):
+    @property
+    def shots(self):
+        return self.shots_for(self.size)
 
-        size = {'big':'medium', 'medium':'small', 'small':None}.get(self.size)
-        if size is not None:
-            for _ in range(3):
-                Asteroid(self.screen, self.pos, None, size, self.groups())
-        self.kill()
+    @classmethod
+    def shots_for(cls, size):
+        # shots needed to clear an asteroid: one, plus those for its pieces;
+        # worked out each time, since pieces may be tuned (batch.py --set)
+        piece = cls.PIECES.get(size)
+        return 1 if piece is None else 1 + cls.pieces * cls.shots_for(piece)
+
+    def _bucket(self):
+        bucket = super()._bucket()
+        if self.lod and (self.size == 'small' or
+                         abs(self.angular_velocity) >= self.max_spin - 1):
+            bucket -= bucket % self.lod_step
+        return bucket
 
     def update(self):
-        self._count = next(self.counter)
-        self.direction = self.direction.rotate(self.angular_velocity)
+        self.direction.rotate_ip(self.angular_velocity)
         super().update()
 
 
 
 class Bullet(GameObject):
+    __slots__ = ()
+    _pool = []
+
     def __init__(self, screen, pos, velocity, groups=()):
         super().__init__(screen, None, pos, velocity, groups)
-        self.direction = self.velocity
+        self.direction.update(self.velocity)
+
+    def reset(self, screen, pos, velocity, groups=()):
+        self._reset(screen, None, pos, velocity, groups)
+        self.direction.update(self.velocity)
     
     @classmethod
     def _load_images(cls):
@@ -286,7 +480,8 @@ class Bullet(GameObject):
             if not pygame.get_init():
                 pygame.init()
             #cls._images = {None: pygame.image.load('beam.png').convert_alpha()}
-            cls._images = {None: load_and_scale('beam.png', (30, 54)).convert_alpha()}
+            cls._images = {None: assets.image('beam.png', scaled((30, 54)))}
+            rotation_cache.preload((cls, None), cls._images[None])
             cls._images_loaded = True
 
     def update(self):
@@ -294,3 +489,85 @@ class Bullet(GameObject):
         if not self.rect.colliderect(self.screen.get_rect()):
             self.kill()
 
+
+def explosion_frames(size):
+    # the sheet's frames are 256x256; size is at sprite scale 1
+    if sprite_scale == 1 and size == (256, 256):
+        return assets.sheet('explosion.png', (8, 8))
+    return assets.sheet('explosion.png', (8, 8), scaled(size))
+
+
+class Explosion(Sprite):
+    """
+    Effect sprite playing a shared Animation where an asteroid broke up.
+
+    It only exists for the picture: nothing collides with it and it isn't
+    part of snapshots. Explosions are pooled, their frames are prebuilt for
+    every asteroid size by preload(), and variant picks one of the
+    animation's orientations.
+    """
+    __slots__ = ('animation', 'variant', 'age', 'image', 'rect', '_pooled')
+    # explosion cell size per asteroid size, at sprite scale 1
+    SIZES = {'small': (96, 96), 'medium': (192, 192), 'big': (240, 240)}
+    _images_loaded = False
+    _animations = {}
+    _pool = []
+    _pool_size = 256
+
+    def __init__(self, animation, pos, variant=0, groups=()):
+        super().__init__()
+        self.rect = Rect(0, 0, 0, 0)
+        self.reset(animation, pos, variant, groups)
+
+    def reset(self, animation, pos, variant=0, groups=()):
+        self.animation = animation
+        self.variant = variant
+        self.age = 0
+        self.image = animation.frame(0, self.variant)
+        self.rect.size = self.image.get_size()
+        self.rect.center = pos
+        self._pooled = False
+        self.add(*groups)
+
+    @classmethod
+    def spawn(cls, size, pos, variant=0, groups=()):
+        animation = cls._animations[size]
+        if cls._pool:
+            explosion = cls._pool.pop()
+            explosion.reset(animation, pos, variant, groups)
+            return explosion
+        return cls(animation, pos, variant, groups)
+
+    @classmethod
+    def _load_images(cls):
+        if not cls._images_loaded:
+            # every other frame, shown for two ticks: as long as the ship's
+            # explosion at half the memory
+            cls._animations = {
+                size: Animation(explosion_frames(dims), ticks_per_frame=2,
+                                step=2, variants=2)
+                for size, dims in cls.SIZES.items()}
+            cls._images_loaded = True
+
+    @classmethod
+    def preload(cls):
+        cls._load_images()
+        for animation in cls._animations.values():
+            animation.prepare()
+
+    def update(self):
+        self.age += 1
+        if self.age >= len(self.animation):
+            self.kill()
+            return
+        center = self.rect.center
+        self.image = self.animation.frame(self.age, self.variant)
+        self.rect.size = self.image.get_size()
+        self.rect.center = center
+
+    def kill(self):
+        super().kill()
+        if not self._pooled and len(self._pool) < self._pool_size:
+            self._pooled = True
+            self._pool.append(self)
+
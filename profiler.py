@@ -0,0 +1,215 @@
+import json
+import time
+from collections import defaultdict, deque
+import pygame
+
+# colors of the phases in the overlay graph, in hook order
+PHASE_COLORS = [(90, 160, 255), (255, 200, 60), (110, 220, 110),
+                (240, 100, 90), (200, 120, 240), (90, 220, 220)]
+IDLE_COLOR = (90, 90, 90)
+
+
+class Profiler:
+    """
+    Opt-in frame profiler.
+
+    Nothing is measured unless hook() has replaced a method or function with
+    a timing (or counting) wrapper, so code that isn't hooked runs untouched
+    and a game without a profiler pays nothing. frame() closes a frame: the
+    time spent in every hooked section, the counters and the sampled gauges
+    of the last `history` frames feed the overlay, and every section call is
+    kept as an event for export() as a Chrome trace (chrome://tracing or
+    Perfetto).
+    """
+
+    def __init__(self, history=240, max_events=200000):
+        self.history = history
+        # (frame seconds, {section: seconds}, {counter: value}) per frame
+        self.frames = deque(maxlen=history)
+        self.events = deque(maxlen=max_events)
+        self.samples = deque(maxlen=max_events)
+        self.counters = defaultdict(int)
+        self.phases = []
+        self.overlay = True
+        self._sections = defaultdict(float)
+        self._gauges = {}
+        self._known = set()
+        self._hooks = []
+        self._origin = time.perf_counter()
+        self._frame_start = self._origin
+        self._font = None
+
+    def hook(self, obj, attr, name=None, timed=True, phase=False):
+        """
+        Replace obj.attr with a wrapper that times each call as section name
+        (or, with timed=False, only counts the calls). Phases are drawn as
+        the stacked bars of the overlay graph; they shouldn't nest.
+        """
+        func = getattr(obj, attr)
+        name = attr if name is None else name
+        wrapper = (self._timed if timed else self._counted)(func, name)
+        self._hooks.append((obj, attr, attr in vars(obj), func))
+        setattr(obj, attr, wrapper)
+        if phase:
+            self.phases.append(name)
+        return wrapper
+
+    def unhook(self, target=None):
+        """Put back everything hook() replaced, or only what it did on target."""
+        kept = []
+        while self._hooks:
+            hook = obj, attr, owned, func = self._hooks.pop()
+            if target is not None and obj is not target:
+                kept.append(hook)
+            elif owned:
+                setattr(obj, attr, func)
+            else:
+                delattr(obj, attr)
+        self._hooks[:] = reversed(kept)
+        if target is None:
+            self.phases.clear()
+
+    def _timed(self, func, name):
+        clock = time.perf_counter
+        sections = self._sections
+        events = self.events
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                end = clock()
+                sections[name] += end - start
+                events.append((name, start, end))
+        return timed
+
+    def _counted(self, func, name):
+        counters = self.counters
+
+        def counted(*args, **kwargs):
+            counters[name] += 1
+            return func(*args, **kwargs)
+        return counted
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def gauge(self, name, func, delta=False):
+        """
+        Sample func() at the end of every frame as counter name; with delta,
+        record how much it grew since the previous frame instead.
+        """
+        self._gauges[name] = [func, delta, func() if delta else 0]
+
+    def frame(self):
+        now = time.perf_counter()
+        counters = self.counters
+        for name, gauge in self._gauges.items():
+            func, delta, last = gauge
+            value = func()
+            if delta:
+                counters[name] = value - last
+                gauge[2] = value
+            else:
+                counters[name] = value
+        # counters that weren't touched this frame are reported as 0
+        self._known.update(counters)
+        for name in self._known:
+            counters.setdefault(name, 0)
+        self.frames.append((now - self._frame_start, dict(self._sections),
+                            dict(counters)))
+        self.events.append(('frame', self._frame_start, now))
+        self.samples.append((now, dict(counters)))
+        self._sections.clear()
+        counters.clear()
+        self._frame_start = now
+
+    def summary(self, frames=60):
+        """Mean milliseconds per section and counter values over frames."""
+        recent = list(self.frames)[-frames:]
+        if not recent:
+            return 0.0, {}, {}
+        sections = defaultdict(float)
+        for _, frame_sections, _ in recent:
+            for name, seconds in frame_sections.items():
+                sections[name] += seconds
+        n = len(recent)
+        frame_ms = sum(frame[0] for frame in recent) * 1e3 / n
+        return (frame_ms, {name: seconds * 1e3 / n
+                           for name, seconds in sections.items()},
+                recent[-1][2])
+
+    def draw(self, surface, budget_ms=1000 / 60, scale=3):
+        """
+        Draw the overlay in the top right corner of surface: a rolling graph
+        of frame times split by phase (grey is everything unhooked, including
+        waiting for the next frame; the line is budget_ms) and the mean
+        section times and latest counters. Returns the rect drawn.
+        """
+        if self._font is None:
+            self._font = pygame.font.Font(None, 20)
+        font = self._font
+        frame_ms, sections, counters = self.summary()
+        lines = ['frame %6.2f ms  %5.1f fps' % (
+            frame_ms, 1000 / frame_ms if frame_ms else 0)]
+        lines += ['%-16s %6.2f ms' % (name, ms)
+                  for name, ms in sorted(sections.items(),
+                                         key=lambda item: -item[1])]
+        lines += ['%-16s %6d' % (name, value)
+                  for name, value in sorted(counters.items())]
+
+        graph_h = 100
+        width = self.history + 8
+        height = graph_h + 12 + font.get_linesize() * len(lines)
+        rect = pygame.Rect(surface.get_width() - width, 0, width, height)
+        panel = pygame.Surface(rect.size, pygame.SRCALPHA)
+        panel.fill((0, 0, 0, 190))
+
+        bottom = graph_h + 4
+        x = 4 + self.history - len(self.frames)
+        for frame_s, frame_sections, _ in self.frames:
+            y = bottom
+            for i, phase in enumerate(self.phases):
+                h = frame_sections.get(phase, 0.0) * 1e3 * scale
+                if h > 0:
+                    pygame.draw.line(panel, PHASE_COLORS[i % len(PHASE_COLORS)],
+                                     (x, y), (x, max(y - h, 4)))
+                    y -= h
+            h = frame_s * 1e3 * scale
+            if bottom - h < y:
+                pygame.draw.line(panel, IDLE_COLOR, (x, y),
+                                 (x, max(bottom - h, 4)))
+            x += 1
+        budget = bottom - budget_ms * scale
+        pygame.draw.line(panel, (255, 255, 255), (4, budget),
+                         (width - 4, budget))
+
+        y = graph_h + 8
+        for line in lines:
+            name = line.split(' ', 1)[0]
+            color = (PHASE_COLORS[self.phases.index(name) % len(PHASE_COLORS)]
+                     if name in self.phases else (220, 220, 220))
+            panel.blit(font.render(line, True, color), (4, y))
+            y += font.get_linesize()
+        surface.blit(panel, rect)
+        return rect
+
+    def export(self, path):
+        """
+        Write the recorded sections, frames and counters as a Chrome trace
+        (JSON object format, timestamps in microseconds).
+        """
+        origin = self._origin
+        trace = [{'name': name, 'ph': 'X', 'pid': 0, 'tid': 0,
+                  'ts': round((start - origin) * 1e6, 3),
+                  'dur': round((end - start) * 1e6, 3)}
+                 for name, start, end in self.events]
+        for when, counters in self.samples:
+            ts = round((when - origin) * 1e6, 3)
+            trace += [{'name': name, 'ph': 'C', 'pid': 0, 'ts': ts,
+                       'args': {name: value}}
+                      for name, value in counters.items()]
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': trace, 'displayTimeUnit': 'ms'}, f)
+        return len(trace)
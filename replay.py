@@ -0,0 +1,83 @@
+import json
+import struct
+from controls import pack_controls, unpack_controls
+
+MAGIC = b'MDRP'
+VERSION = 2
+# magic, format version, RNG seed, length of the settings; followed by the
+# game's settings as JSON and one byte of controls per step
+HEADER = struct.Struct('<4sHQI')
+
+
+class Recorder:
+    """
+    Write the RNG seed, the game's settings (see MeteorDerby.settings) and
+    the controls of every simulation step to a compact binary file that
+    Replay can feed back into the game.
+    """
+
+    def __init__(self, path, seed, settings):
+        self.path = path
+        self.seed = seed
+        self.settings = settings
+        data = json.dumps(self.settings, sort_keys=True).encode()
+        self._file = open(path, 'wb')
+        self._file.write(HEADER.pack(MAGIC, VERSION, seed, len(data)))
+        self._file.write(data)
+        self.ticks = 0
+
+    def record(self, controls):
+        self._file.write(bytes((pack_controls(controls),)))
+        self.ticks += 1
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class Replay:
+    """A recording made by Recorder: its seed, settings and iterable controls."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            data = f.read()
+        try:
+            magic, version, self.seed, size = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError(f'{path} is not a MeteorDerby recording')
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a MeteorDerby recording')
+        if version != VERSION:
+            raise ValueError(f'{path} is a version {version} recording; '
+                             f'this game plays version {VERSION}')
+        start = HEADER.size + size
+        self.settings = json.loads(data[HEADER.size:start])
+        self._steps = data[start:]
+
+    def check(self, settings):
+        """
+        Raise ValueError, naming every difference, unless settings are the
+        ones the recording was made with.
+        """
+        # through JSON, so that tuples compare equal to the recorded lists
+        settings = json.loads(json.dumps(settings))
+        differences = [
+            f'{name} {self.settings.get(name)!r} (now {settings.get(name)!r})'
+            for name in sorted(set(self.settings) | set(settings))
+            if self.settings.get(name) != settings.get(name)]
+        if differences:
+            raise ValueError(f'{self.path} was recorded with different '
+                             f'settings: ' + ', '.join(differences))
+
+    def __len__(self):
+        return len(self._steps)
+
+    def __iter__(self):
+        return map(unpack_controls, self._steps)
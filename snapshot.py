@@ -0,0 +1,265 @@
+import socket
+import struct
+import sys
+import zlib
+from itertools import starmap
+
+MAGIC = b'MDWS'
+VERSION = 1
+KEY, DELTA = 0, 1
+# magic, format version, frame type, game status, paused, tick, shots left,
+# next object id, entity records, pending pieces, free entity slots
+HEADER = struct.Struct('<4sBBBBIiIIII')
+# random.Random state: version 3 words plus the cached gauss value
+RNG = struct.Struct('<625I?d')
+# id, kind, size, flags, animation age in ticks, position, velocity,
+# heading, spin; the heading is the direction vector, or (angle, 0) for
+# entities stored in an EntityWorld
+RECORD = struct.Struct('<IBBBBddddddd')
+ID = struct.Struct('<I')
+PIECE = struct.Struct('<ddB')
+FRAME = struct.Struct('<I')
+
+SHIP, ASTEROID, BULLET = range(3)
+# EntityWorld entities have no ids of their own; they are numbered by slot
+# from here, above any GameObject id
+SLOT_ID = 1 << 31
+# record sizes; 0 for objects without one
+SIZES = (None, 'small', 'medium', 'big')
+SIZE_CODE = {size: code for code, size in enumerate(SIZES)}
+STATUS = ('', 'You won!', 'You lost!')
+# record flags
+ALIVE = 1          # the ship can still be hit
+ANIMATING = 2      # the ship is exploding; the age says how far along
+KILLED = 4         # the ship is gone after its explosion
+
+
+class Snapshot:
+    """
+    The simulation state of a game at the end of a tick, in a fixed binary
+    layout: the header, the RNG state, one RECORD per object sorted by id,
+    the asteroid pieces still waiting for the spawn budget and, for an
+    EntityWorld, its free slots. pack() and Snapshot.unpack() convert it
+    to and from bytes; Encoder and Decoder turn a sequence of them into
+    compressed deltas.
+    """
+    __slots__ = ('tick', 'shots', 'status', 'paused', 'next_id', 'rng',
+                 'records', 'pieces', 'free', '_ids')
+
+    def __init__(self, tick, shots, status, paused, next_id, rng, records,
+                 pieces=(), free=()):
+        self.tick = tick
+        self.shots = shots
+        self.status = status
+        self.paused = paused
+        self.next_id = next_id
+        self.rng = rng
+        self.records = records
+        self.pieces = list(pieces)
+        self.free = list(free)
+        self._ids = None
+
+    def __len__(self):
+        return len(self.records) // RECORD.size
+
+    def __iter__(self):
+        return RECORD.iter_unpack(self.records)
+
+    @classmethod
+    def from_rows(cls, rows, tick, shots, status, paused, next_id, rng_state,
+                  pieces=(), free=()):
+        """
+        Build a snapshot from one tuple of RECORD fields per object, in any
+        order, and the state returned by random.Random.getstate().
+        """
+        rows.sort()
+        snapshot = cls(tick, shots, status, paused, next_id,
+                       pack_rng(rng_state),
+                       b''.join(starmap(RECORD.pack, rows)), pieces, free)
+        snapshot._ids = [row[0] for row in rows]
+        return snapshot
+
+    def ids(self):
+        if self._ids is None:
+            self._ids = _ids(self.records)
+        return self._ids
+
+    def _header(self, kind):
+        return HEADER.pack(MAGIC, VERSION, kind, self.status, self.paused,
+                           self.tick, self.shots, self.next_id, len(self),
+                           len(self.pieces), len(self.free))
+
+    def _tail(self):
+        return b''.join([PIECE.pack(*piece) for piece in self.pieces] +
+                        [ID.pack(slot) for slot in self.free])
+
+    def pack(self):
+        return self._header(KEY) + self.rng + self.records + self._tail()
+
+    @classmethod
+    def unpack(cls, data):
+        return cls._unpack(data, KEY)[0]
+
+    @classmethod
+    def _unpack(cls, data, kind=None):
+        data = memoryview(data)
+        try:
+            (magic, version, frame, status, paused, tick, shots, next_id, n,
+             pieces, free) = HEADER.unpack_from(data)
+        except struct.error:
+            raise ValueError('not a MeteorDerby snapshot')
+        if magic != MAGIC or version != VERSION or (
+                kind is not None and frame != kind):
+            raise ValueError('not a MeteorDerby snapshot')
+        offset = HEADER.size
+        rng = bytes(data[offset:offset + RNG.size])
+        offset += RNG.size
+        records = bytes(data[offset:offset + n * RECORD.size])
+        offset += n * RECORD.size
+        piece_list = list(PIECE.iter_unpack(
+            data[offset:offset + pieces * PIECE.size]))
+        offset += pieces * PIECE.size
+        free_list = [slot for slot, in ID.iter_unpack(
+            data[offset:offset + free * ID.size])]
+        return cls(tick, shots, status, paused, next_id, rng, records,
+                   piece_list, free_list), frame
+
+
+def _ids(records):
+    # a record starts with its id
+    return [ID.unpack_from(records, i)[0]
+            for i in range(0, len(records), RECORD.size)]
+
+
+def pack_rng(state):
+    version, words, gauss = state
+    return RNG.pack(*words, gauss is not None, gauss or 0.0)
+
+
+def unpack_rng(data):
+    *words, cached, gauss = RNG.unpack(data)
+    return (3, tuple(words), gauss if cached else None)
+
+
+def _xor(a, b):
+    n = len(a)
+    return (int.from_bytes(a, 'little') ^
+            int.from_bytes(b, 'little')).to_bytes(n, 'little')
+
+
+def _aligned(previous, ids):
+    # the previous tick's record of every current id (zeros for new ones),
+    # so that a delta XORs each object against itself
+    size = RECORD.size
+    old = previous.records
+    index = {id: i for i, id in enumerate(previous.ids())}
+    zero = bytes(size)
+    return b''.join([old[index[id] * size:(index[id] + 1) * size]
+                     if id in index else zero for id in ids])
+
+
+class Encoder:
+    """
+    Turns consecutive snapshots into compact frames: a key frame (the whole
+    snapshot, compressed) every keyframe_every frames and deltas between
+    them. A delta XORs every record with the previous tick's record of the
+    same object and the RNG state with the previous one; what hasn't
+    changed becomes zero bytes, which compress to next to nothing. Record
+    ids are kept as they are, so the decoder can line the records up again.
+    """
+
+    def __init__(self, keyframe_every=60, level=1):
+        self.keyframe_every = keyframe_every
+        self.level = level
+        self._previous = None
+        self._frames = 0
+
+    def key(self):
+        """Make the next frame a key frame (e.g. for a new spectator)."""
+        self._previous = None
+
+    def encode(self, snapshot):
+        previous = self._previous
+        if previous is None or self._frames % self.keyframe_every == 0:
+            previous = None
+        self._previous = snapshot
+        self._frames += 1
+        if previous is None:
+            body = snapshot.rng + snapshot.records + snapshot._tail()
+            return snapshot._header(KEY) + zlib.compress(body, self.level)
+        ids = snapshot.ids()
+        body = b''.join((
+            _xor(snapshot.rng, previous.rng),
+            struct.pack('<%dI' % len(ids), *ids),
+            _xor(snapshot.records, _aligned(previous, ids)),
+            snapshot._tail()))
+        return snapshot._header(DELTA) + zlib.compress(body, self.level)
+
+
+class Decoder:
+    """Rebuilds the snapshots from the frames of an Encoder, in order."""
+
+    def __init__(self):
+        self._previous = None
+
+    def decode(self, frame):
+        frame = memoryview(frame)
+        header = frame[:HEADER.size]
+        body = zlib.decompress(frame[HEADER.size:])
+        fields = HEADER.unpack(header)
+        kind, n = fields[2], fields[8]
+        if kind == DELTA:
+            previous = self._previous
+            if previous is None:
+                raise ValueError('delta frame without a key frame before it')
+            rng = _xor(body[:RNG.size], previous.rng)
+            offset = RNG.size
+            ids = list(struct.unpack_from('<%dI' % n, body, offset))
+            offset += n * ID.size
+            records = _xor(body[offset:offset + n * RECORD.size],
+                           _aligned(previous, ids))
+            offset += n * RECORD.size
+            body = rng + records + body[offset:]
+        snapshot, _ = Snapshot._unpack(bytes(header) + body)
+        self._previous = snapshot
+        return snapshot
+
+
+def open_stream(target, mode):
+    """
+    Open target for writing ('w') or reading ('r') snapshot frames: '-' is
+    stdout or stdin, HOST:PORT a TCP connection (the reader listens, the
+    writer connects) and anything else a file.
+    """
+    if target == '-':
+        return sys.stdout.buffer if mode == 'w' else sys.stdin.buffer
+    host, _, port = target.rpartition(':')
+    if port.isdigit():
+        if mode == 'w':
+            connection = socket.create_connection((host or 'localhost',
+                                                   int(port)))
+        else:
+            with socket.create_server((host, int(port))) as server:
+                connection, _ = server.accept()
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = connection.makefile(mode + 'b')
+        connection.close()  # the file keeps the socket open
+        return stream
+    return open(target, mode + 'b')
+
+
+def write_frame(stream, frame):
+    stream.write(FRAME.pack(len(frame)))
+    stream.write(frame)
+
+
+def read_frame(stream):
+    """Return the next frame, or None at the end of the stream."""
+    header = stream.read(FRAME.size)
+    if len(header) < FRAME.size:
+        return None
+    size, = FRAME.unpack(header)
+    frame = stream.read(size)
+    if len(frame) < size:
+        return None
+    return frame
@@ -1,24 +1,33 @@
 import math
 import random
+from collections import OrderedDict, namedtuple
 from pygame import Surface
 from pygame.math import Vector2
 
 
+# all gameplay randomness goes through rng so that a seed reproduces a game
+rng = random.Random()
+
+
+def seed_rng(seed):
+    rng.seed(seed)
+
+
 def get_random_pos(surface: Surface):
-    angle = 2 * math.pi * random.random()
+    angle = 2 * math.pi * rng.random()
     #angle = 360 * random.random()
     hw = int(surface.get_width() / 2)
     hh = int(surface.get_height() / 2)
     rad = min(hw, hh)
     return Vector2(hw + rad * math.sin(angle), hh + rad * math.cos(angle))
 
-    return Vector2(surface.get_height() * random.random(),
-                    surface.get_width() * random.random()) 
+    return Vector2(surface.get_height() * rng.random(),
+                    surface.get_width() * rng.random()) 
 
-def get_random_vel():
+def get_random_vel(max_speed=2.0):
 
-    return Vector2(4.0 * (random.random() - 0.5),
-                   4.0 * (random.random() - 0.5))
+    return Vector2(2.0 * max_speed * (rng.random() - 0.5),
+                   2.0 * max_speed * (rng.random() - 0.5))
 
 
 def change_dir(direction, angle_deg, acceleration):
@@ -27,16 +36,85 @@ def change_dir(direction, angle_deg, acceleration):
     direction[1] += math.sin(angle) * acceleration
 
 
-def print_text(surface, text, font, pos=None):
+class TextCache:
+    """
+    Bounded LRU cache of rendered text surfaces keyed by (text, font, color),
+    so HUD text is only rasterized when it changes.
+    """
+
+    def __init__(self, maxsize=64):
+        self.maxsize = maxsize
+        self._surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, text, font, color):
+        key = (text, font, tuple(color))
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self._surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, 1, color)
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.maxsize:
+            self._surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self._surfaces.clear()
+
+
+text_cache = TextCache()
+
+
+def print_text(surface, text, font, pos=None, color=(0, 200, 0)):
     w, h = surface.get_size()
-    text_surface = font.render(text, 1, (0, 200, 0))
+    text_surface = text_cache.render(text, font, color)
     rect = text_surface.get_rect()
     rect.center = [w / 2, h / 2]
 
     if pos is None:
-        surface.blit(text_surface, rect)
+        return surface.blit(text_surface, rect)
     else:
-        surface.blit(text_surface, pos)
+        return surface.blit(text_surface, pos)
+
+
+def draw_group(surface, sprites):
+    """Like Group.draw, but returns the list of drawn (clipped) rects."""
+    return surface.blits([(sprite.image, sprite.rect) for sprite in sprites])
+
+
+def draw_visible(surface, sprites):
+    """
+    Like draw_group, but skips the sprites whose visible() is false before
+    their rect is looked at.
+    """
+    return surface.blits([(sprite.image, sprite.rect) for sprite in sprites
+                          if sprite.visible()])
+
+
+def draw_wrapped(surface, sprites):
+    """
+    Draw sprites on a toroidal surface, adding the extra blits needed by
+    sprites whose rect crosses a border. Returns the list of drawn rects.
+    """
+    w, h = surface.get_size()
+    blits = []
+    for sprite in sprites:
+        image, rect = sprite.image, sprite.rect
+        blits.append((image, rect))
+        xs = (-w,) if rect.right > w else (w,) if rect.left < 0 else ()
+        ys = (-h,) if rect.bottom > h else (h,) if rect.top < 0 else ()
+        for dx in xs:
+            blits.append((image, rect.move(dx, 0)))
+        for dy in ys:
+            blits.append((image, rect.move(0, dy)))
+            for dx in xs:
+                blits.append((image, rect.move(dx, dy)))
+    return surface.blits(blits)
 
 
 import pygame
@@ -47,14 +125,18 @@ def load_and_scale(image_path, target_size):
     while preserving aspect ratio.
     
     Args:
-        image_path (str): The path to the image file.
+        image_path (str or pygame.Surface): The path to the image file, or an
+        already loaded image.
         target_size (tuple): A tuple containing the target width and height
         (target_width, target_height).
         
     Returns:
         pygame.Surface: The scaled image surface.
     """
-    original_image = pygame.image.load(image_path).convert_alpha()
+    if isinstance(image_path, pygame.Surface):
+        original_image = image_path
+    else:
+        original_image = pygame.image.load(image_path).convert_alpha()
     original_size = original_image.get_size()
     target_width, target_height = target_size
     
@@ -72,8 +154,24 @@ def load_and_scale(image_path, target_size):
     
     return scaled_image
 
+class SilentSound:
+    """Stand-in for pygame.mixer.Sound when the mixer is not initialized."""
+
+    def play(self, *args, **kwargs):
+        return None
+
+    def stop(self):
+        pass
+
+
+def load_sound(path):
+    if not pygame.mixer.get_init():
+        return SilentSound()
+    return pygame.mixer.Sound(path)
+
+
 def get_random_spin(max_spin):
-    angle = random.randrange(-max_spin + 1, max_spin)
+    angle = rng.randrange(-max_spin + 1, max_spin)
     return angle
 
 
@@ -89,7 +187,6 @@ def load_sprite_sheet(source, dimensions, scale=None):
         sheet = source
     else:
         raise ValueError("source is not a filename or a Surface.")
-    sheet = pygame.image.load(source).convert_alpha()
     sheet_width, sheet_height = sheet.get_size()
     rows, cols = dimensions
     cell_width = sheet_width // cols
@@ -103,3 +200,215 @@ def load_sprite_sheet(source, dimensions, scale=None):
                 cell_image = pygame.transform.scale(cell_image, scale)
             frames.append(cell_image)
     return frames
+
+
+Rotation = namedtuple('Rotation', 'image size mask')
+
+
+class RotationCache:
+    """
+    Bounded LRU cache of pre-rotated surfaces and their collision masks.
+
+    Entries are keyed by an arbitrary image key (typically the tuple
+    (class, size)) plus the quantized angle bucket, so every
+    instance of a sprite class shares the same rotated frames. Frames added
+    with preload() are pinned and never evicted.
+    """
+
+    def __init__(self, step=3, maxsize=4096):
+        self.step = step
+        self.buckets = int(round(360 / step))
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._pinned = {}
+        self.hits = 0
+        self.misses = 0
+
+    def bucket(self, angle):
+        return int(round(angle / self.step)) % self.buckets
+
+    def get(self, key, bucket, source):
+        entry_key = (key, bucket)
+        entry = self._pinned.get(entry_key)
+        if entry is not None:
+            self.hits += 1
+            return entry
+
+        entry = self._entries.get(entry_key)
+        if entry is not None:
+            self._entries.move_to_end(entry_key)
+            self.hits += 1
+            return entry
+
+        self.misses += 1
+        entry = self._rotate(source, bucket)
+        self._entries[entry_key] = entry
+        if len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return entry
+
+    def preload(self, key, source):
+        for bucket in range(self.buckets):
+            if (key, bucket) not in self._pinned:
+                self._pinned[(key, bucket)] = self._rotate(source, bucket)
+
+    def _rotate(self, source, bucket):
+        image = pygame.transform.rotate(source, bucket * self.step)
+        return Rotation(image, image.get_size(), pygame.mask.from_surface(image))
+
+    def clear(self):
+        self._entries.clear()
+        self._pinned.clear()
+
+    def __len__(self):
+        return len(self._entries) + len(self._pinned)
+
+
+def trim_centered(surface):
+    """
+    Return a copy of surface cut down to the smallest rect that has the same
+    center and still holds every visible pixel, so that a sprite drawn
+    centered on its position looks the same.
+    """
+    w, h = surface.get_size()
+    bounds = surface.get_bounding_rect()
+    if not bounds.w or not bounds.h:
+        return pygame.Surface((0, 0), pygame.SRCALPHA)
+    half_w = max(w // 2 - bounds.left, bounds.right - w // 2)
+    half_h = max(h // 2 - bounds.top, bounds.bottom - h // 2)
+    rect = pygame.Rect(w // 2 - half_w, h // 2 - half_h, 2 * half_w, 2 * half_h)
+    return surface.subsurface(rect.clip(surface.get_rect())).copy()
+
+
+class Animation:
+    """
+    Frames prepared once and shared by every sprite that plays them.
+
+    Every frame (every step-th frame of the source, shown ticks_per_frame
+    ticks each) is trimmed with trim_centered and prebuilt in `variants`
+    quarter-turn orientations; turning by multiples of 90 degrees is exact,
+    so concurrent copies can differ without any rotation while playing.
+    Playback follows simulation ticks: frame(age) is a list lookup.
+
+    The frames are built by prepare(), or else when the first one is shown;
+    the duration is known without them, which is all a headless game uses.
+    """
+
+    def __init__(self, frames, ticks_per_frame=1, step=1, variants=1):
+        self._source = frames[::step]
+        self._count = variants
+        self._variants = None
+        self.ticks_per_frame = ticks_per_frame
+        self.duration = len(self._source) * ticks_per_frame
+
+    def __len__(self):
+        return self.duration
+
+    def prepare(self):
+        if self._variants is None:
+            frames = [trim_centered(frame) for frame in self._source]
+            self._variants = [frames] + [
+                [pygame.transform.rotate(frame, 90 * turn) for frame in frames]
+                for turn in range(1, self._count)]
+            self._source = None
+        return self
+
+    def frame(self, age, variant=0):
+        """The frame shown age ticks in; age must be below duration."""
+        variants = self._variants
+        if variants is None:
+            variants = self.prepare()._variants
+        return variants[variant % len(variants)][age // self.ticks_per_frame]
+
+
+class AssetRegistry:
+    """
+    Process-wide cache of images, scaled variants, sprite sheets and sounds.
+
+    Every asset is read from disk at most once; later requests for the same
+    (kind, path, parameters) return the shared object. hits and misses count
+    lookups served from the cache and loads that had to be done.
+    """
+
+    def __init__(self):
+        self._assets = {}
+        self.hits = 0
+        self.misses = 0
+        # optional assetcache.BakedAssets consulted before decoding files
+        self.baked = None
+
+    def _get(self, key, load):
+        asset = self._assets.get(key)
+        if asset is not None:
+            self.hits += 1
+            return asset
+        self.misses += 1
+        asset = self._assets[key] = load()
+        return asset
+
+    def image(self, path, size=None, alpha=True):
+        """
+        Return the image at path, converted for the display. With a size, the
+        image is scaled to fit it (see load_and_scale), decoding the source
+        file only once for all sizes.
+        """
+        def load():
+            if self.baked is not None:
+                image = self.baked.image(path, size, alpha)
+                if image is not None:
+                    return image
+            if size is not None:
+                return self._convert(load_and_scale(self.image(path), size),
+                                     alpha)
+            return self._convert(pygame.image.load(path), alpha)
+
+        return self._get(('image', path, None if size is None else tuple(size),
+                          alpha), load)
+
+    @staticmethod
+    def _convert(image, alpha):
+        return image.convert_alpha() if alpha else image.convert()
+
+    def sheet(self, path, dimensions, scale=None):
+        def load():
+            if self.baked is not None:
+                frames = self.baked.sheet(path, dimensions, scale)
+                if frames is not None:
+                    return frames
+            return load_sprite_sheet(self.image(path), dimensions, scale)
+
+        key = ('sheet', path, tuple(dimensions),
+               None if scale is None else tuple(scale))
+        return self._get(key, load)
+
+    def sound(self, path):
+        return self._get(('sound', path), lambda: load_sound(path))
+
+    def preload(self, images=(), sheets=(), sounds=()):
+        """
+        Load assets ahead of time. images are paths or (path, size) pairs,
+        sheets (path, dimensions) pairs and sounds paths.
+        """
+        for image in images:
+            if isinstance(image, str):
+                self.image(image)
+            else:
+                self.image(*image)
+        for path, dimensions in sheets:
+            self.sheet(path, dimensions)
+        for path in sounds:
+            self.sound(path)
+
+    def items(self):
+        return self._assets.items()
+
+    def clear(self, kind=None):
+        """Forget every cached asset, or only those of kind ('sound', ...)."""
+        if kind is None:
+            self._assets.clear()
+        else:
+            for key in [key for key in self._assets if key[0] == kind]:
+                del self._assets[key]
+
+
+assets = AssetRegistry()